@@ -0,0 +1,177 @@
+import argparse, json, os, sys, time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+
+from replay import list_videos, replay_video
+
+# 分割したシャードの前に余分に処理する秒数（結果は捨てる）。方向の継続時間
+# （distraction_time 5秒）と通知のクールダウン（10秒）を前のシャードから引き継ぐのに足りる長さ
+WARMUP_SECONDS = 20.0
+
+def _init_worker():
+    """ワーカー初期化：mediapipe を読み込んでおき、print を捨てる"""
+    import mediapipe  # noqa: F401  （シャードごとの FaceMesh 作成で読み込みを待たない）
+
+    # プロセス数ぶん並列に動くので OpenCV 内部のスレッドは使わない
+    cv2.setNumThreads(1)
+    sys.stdout = open(os.devnull, "w")
+
+
+def _run_shard(shard, face_mesh=None):
+    """1シャード（動画のフレーム範囲）を処理して集計を返す
+
+    FaceMesh は動画モードで前のフレームの追跡状態を持つので、シャードごとに
+    作り直す（どのワーカーがどの順で処理しても結果が同じになるように）。
+    face_mesh を渡した場合はそれを使い、閉じない。
+    """
+    path, start, end, full_rate, warmup = shard
+    owned = face_mesh is None
+    if owned:
+        from eyeDetection import create_face_mesh
+        face_mesh = create_face_mesh()
+    monitor_kwargs = {'face_mesh': face_mesh}
+    if full_rate:
+        monitor_kwargs['adaptive_rate'] = False
+
+    summary = None
+    try:
+        for record in replay_video(path, start, end, monitor_kwargs=monitor_kwargs,
+                                   warmup=warmup):
+            if record['type'] == 'summary':
+                summary = record
+    finally:
+        if owned:
+            face_mesh.close()
+    summary['end'] = start + summary['frames']
+    return summary
+
+
+def make_shards(videos, chunk_frames=None, full_rate=False, warmup_seconds=WARMUP_SECONDS):
+    """動画をシャードに分割する
+
+    chunk_frames を指定すると長い動画をフレーム範囲で分割する。各シャードは
+    開始点の warmup_seconds 秒前から処理し、その分の結果は捨てる（監視の状態を
+    前のシャードから引き継いだのと同じにするため）。同じ方向が warmup_seconds 秒より
+    長く続いたまま分割点をまたぐと、通知の判定は動画単位の場合と変わることがある。
+    """
+    shards = []
+    for path in videos:
+        if not chunk_frames:
+            shards.append((path, 0, None, full_rate, 0))
+            continue
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        cap.release()
+        if total <= 0:
+            # フレーム数が取れない形式は分割しない
+            shards.append((path, 0, None, full_rate, 0))
+            continue
+        warmup = int(round(warmup_seconds * fps))
+        for start in range(0, total, chunk_frames):
+            shards.append((path, start, min(total, start + chunk_frames), full_rate,
+                           min(start, warmup)))
+    return shards
+
+
+def merge_summaries(summaries):
+    """シャードの集計をセッション（動画）ごとにまとめる
+
+    完了順に依存しないよう (動画, 開始フレーム) の順に並べてから足し合わせる。
+    処理時間は実行ごとに変わるので、ここには含めず全体集計にだけ出す。
+    """
+    sessions = {}
+    for s in sorted(summaries, key=lambda s: (s['video'], s['start'])):
+        session = sessions.setdefault(s['video'], {
+            'type': 'session',
+            'video': s['video'],
+            'shards': 0,
+            'frames': 0,
+            'detected_frames': 0,
+            'skipped_frames': 0,
+            'total_frames': 0,
+            'focused_frames': 0,
+            'notifications': [],
+        })
+        session['shards'] += 1
+        for key in ('frames', 'detected_frames', 'skipped_frames',
+                    'total_frames', 'focused_frames'):
+            session[key] += s[key]
+        session['notifications'].extend(s['notifications'])
+
+    merged = []
+    for session in sessions.values():
+        session['focus_rate'] = (session['focused_frames'] / session['total_frames'] * 100
+                                 if session['total_frames'] > 0 else 0.0)
+        merged.append(session)
+    return merged
+
+
+def run_batch(videos, workers=None, chunk_frames=None, full_rate=False,
+              warmup_seconds=WARMUP_SECONDS):
+    """動画群をプロセスプールで処理し、(セッション集計, 全体集計) を返す"""
+    shards = make_shards(videos, chunk_frames, full_rate, warmup_seconds)
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    # mediapipe / OpenCV のスレッドを fork で複製しないよう spawn を使う
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker) as pool:
+        summaries = list(pool.map(_run_shard, shards))
+    wall = time.perf_counter() - started
+
+    sessions = merge_summaries(summaries)
+    frames = sum(s['frames'] for s in sessions)
+    total = {
+        'type': 'batch',
+        'sessions': len(sessions),
+        'shards': len(shards),
+        'workers': workers,
+        'frames': frames,
+        'total_frames': sum(s['total_frames'] for s in sessions),
+        'focused_frames': sum(s['focused_frames'] for s in sessions),
+        'notifications': sum(len(s['notifications']) for s in sessions),
+        'elapsed_s': round(wall, 4),
+        'fps': round(frames / wall, 2) if wall > 0 else 0.0,
+    }
+    return sessions, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="複数の録画セッションをプロセスプールでまとめて解析し、集計を JSONL で出力する")
+    parser.add_argument("inputs", nargs="+", help="動画ファイル、または動画を含むディレクトリ")
+    parser.add_argument("-o", "--output", help="出力先 JSONL（省略時は標準出力）")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="ワーカープロセス数（省略時は CPU コア数）")
+    parser.add_argument("--chunk-frames", type=int, default=None,
+                        help="長い動画をこのフレーム数ごとに分割して並列処理する")
+    parser.add_argument("--warmup", type=float, default=WARMUP_SECONDS,
+                        help="分割したシャードの前に余分に処理して捨てる秒数"
+                             f"（デフォルト: {WARMUP_SECONDS:g}）")
+    parser.add_argument("--full-rate", action="store_true",
+                        help="推論の間引きをせず全フレームを推論する")
+    args = parser.parse_args(argv)
+
+    videos = [v for path in args.inputs for v in list_videos(path)]
+    if not videos:
+        print("❌ 動画が見つかりません", file=sys.stderr)
+        return 1
+
+    sessions, total = run_batch(videos, args.workers, args.chunk_frames, args.full_rate,
+                                args.warmup)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for record in sessions + [total]:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
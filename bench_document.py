@@ -0,0 +1,88 @@
+"""画像エディタの描画・合成のベンチマーク（Tk なし、document.Document で計測）
+
+使い方: python bench_document.py [--ops 500] [--layers 4] [--size 1500x650]
+操作ごとの描画時間と、操作後の再合成（変わった範囲だけ / 全体 / 旧方式の全レイヤー合成）を計測する。
+"""
+import argparse, random, time
+
+from PIL import Image
+
+from document import Document, parse_size
+
+
+def make_ops(n, w, h, seed=0):
+    """ランダムな操作列（注釈の描画を想定）"""
+    rng = random.Random(seed)
+    ops = []
+    for i in range(n):
+        kind = ("line", "erase", "rect", "oval", "text")[i % 5]
+        x, y = rng.randrange(w), rng.randrange(h)
+        if kind == "line":
+            points = [[x + rng.randint(-40, 40) * j // 4, y + rng.randint(-40, 40) * j // 4]
+                      for j in range(12)]
+            ops.append({'op': "line", 'points': points, 'color': "red", 'width': 5})
+        elif kind == "erase":
+            ops.append({'op': "erase", 'x': x, 'y': y, 'radius': 8})
+        elif kind in ("rect", "oval"):
+            ops.append({'op': kind, 'box': [x, y, x + rng.randint(10, 200), y + rng.randint(10, 120)],
+                        'outline': "blue", 'fill': "#ffee8080" if i % 2 else None})
+        else:
+            ops.append({'op': "text", 'x': x, 'y': y, 'text': "gaze %d" % i, 'size': 20})
+    return ops
+
+
+def merge_all(doc):
+    """旧方式（白背景から全レイヤーを毎回合成）"""
+    base = Image.new("RGBA", (doc.w, doc.h), (255, 255, 255, 255))
+    for layer in doc.layers:
+        base.alpha_composite(layer.image)
+    return base
+
+
+def timed(fn, *args):
+    t = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=500)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--size", type=parse_size, default=(1500, 650))
+    args = parser.parse_args()
+
+    w, h = args.size
+    doc = Document(w, h)
+    for _ in range(args.layers - 1):
+        doc.add_layer()
+    doc.active_layer = args.layers // 2
+    doc.recompose()
+
+    per_op, per_redraw = {}, []
+    for op in make_ops(args.ops, w, h):
+        rect, t_op = timed(doc.apply, op)
+        _, t_redraw = timed(doc.recompose, rect)
+        per_op.setdefault(op["op"], []).append(t_op)
+        per_redraw.append(t_redraw)
+
+    # 合成結果が旧方式と一致することを確認（丸め誤差の 1 以内）
+    diff = max(abs(a - b) for a, b in zip(doc.render().tobytes(), merge_all(doc).tobytes()))
+    assert diff <= 1, diff
+
+    print(f"=== {w}x{h}, {args.layers} レイヤー, {args.ops} 操作 ===")
+    print("--- 操作ごとの描画（履歴の記録を含む） ---")
+    for kind, times in per_op.items():
+        print(f"{kind:>12}: {sum(times) / len(times) * 1e3:8.3f} ms/op  ({len(times)} 回)")
+    print("--- 再合成 ---")
+    print(f"{'dirty rect':>12}: {sum(per_redraw) / len(per_redraw) * 1e3:8.3f} ms/redraw")
+    n = 20
+    _, t = timed(lambda: [doc.recompose() for _ in range(n)])
+    print(f"{'full (cache)':>12}: {t / n * 1e3:8.3f} ms/redraw")
+    _, t = timed(lambda: [merge_all(doc) for _ in range(n)])
+    print(f"{'full (old)':>12}: {t / n * 1e3:8.3f} ms/redraw")
+    print(f"--- 履歴: {len(doc.history.undo_stack)} 件, {doc.history.nbytes / 1024:.1f} KiB ---")
+
+
+if __name__ == "__main__":
+    main()
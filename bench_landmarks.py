@@ -0,0 +1,94 @@
+"""虹彩中心計算のマイクロベンチマーク（旧: リスト + np.mean / 新: LandmarkArray）
+
+使い方: python bench_landmarks.py [--frames 20000]
+FaceMesh は使わず、同じ形のダミーランドマークで計測する。
+比率は旧実装に対する速さ。monitor の行が GazeMonitorWithNotification.estimate_gaze
+が毎フレーム行う処理（虹彩 + ROI 用の顔の端）。478 点すべての変換は遅い経路で、
+毎フレームの処理では使わない（参考値）。
+"""
+import argparse, random, timeit
+import numpy as np
+
+from landmarks import (LandmarkArray, LEFT_IRIS, RIGHT_IRIS, IRIS_ROWS, EYE_ROWS,
+                       NUM_LANDMARKS, screen_gaze)
+from roi import FACE_BOUND_ROWS
+
+# estimate_gaze が変換する行
+MONITOR_ROWS = IRIS_ROWS + FACE_BOUND_ROWS
+
+
+class FakeLandmark:
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+
+def make_landmarks(seed=0):
+    rng = random.Random(seed)
+    return [FakeLandmark(rng.random(), rng.random(), rng.random() * 0.1)
+            for _ in range(NUM_LANDMARKS)]
+
+
+def before(landmarks, w, h):
+    """旧実装（GazeMonitorWithNotification.detect_gaze と同じ計算）"""
+    left_iris = np.mean([
+        [landmarks[i].x * w, landmarks[i].y * h]
+        for i in LEFT_IRIS
+    ], axis=0).astype(int)
+    right_iris = np.mean([
+        [landmarks[i].x * w, landmarks[i].y * h]
+        for i in RIGHT_IRIS
+    ], axis=0).astype(int)
+    eyes_center = ((left_iris + right_iris) / 2).astype(int)
+    gaze_vector = eyes_center - np.array([w // 2, h // 2])
+    return left_iris, right_iris, eyes_center, gaze_vector[0] / (w // 2), gaze_vector[1] / (h // 2)
+
+
+def after(points, landmarks, w, h, rows=IRIS_ROWS):
+    """新実装（必要な行だけ変換してファンシーインデックスで計算）"""
+    points.fill(landmarks, w, h, rows=rows)
+    return screen_gaze(points.iris_centers(), w, h)
+
+
+def after_full(points, landmarks, w, h):
+    """478 点すべてを変換し、虹彩・目の中心・視線比率まで計算"""
+    points.fill(landmarks, w, h)
+    points.gaze_ratios()
+    return screen_gaze(points.iris_centers(), w, h)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    w, h = args.width, args.height
+    landmarks = make_landmarks()
+    points = LandmarkArray()
+
+    # 結果が一致することを確認
+    old = before(landmarks, w, h)
+    for rows in (IRIS_ROWS, MONITOR_ROWS):
+        for a, b in zip(old, after(points, landmarks, w, h, rows=rows)):
+            assert np.allclose(a, b, atol=1), (a, b)
+
+    cases = [
+        ("before (list + np.mean)", lambda: before(landmarks, w, h)),
+        ("monitor (iris + face bounds)", lambda: after(points, landmarks, w, h, rows=MONITOR_ROWS)),
+        ("after  (iris rows)", lambda: after(points, landmarks, w, h)),
+        ("after  (iris + eye rows)", lambda: after(points, landmarks, w, h, rows=EYE_ROWS)),
+        ("slow   (all 478 + ratios)", lambda: after_full(points, landmarks, w, h)),
+    ]
+    print(f"=== 1フレームあたりの処理時間（{args.frames} フレーム） ===")
+    baseline = None
+    for name, fn in cases:
+        per_frame = min(timeit.repeat(fn, number=args.frames, repeat=3)) / args.frames
+        baseline = baseline or per_frame
+        print(f"{name:>30}: {per_frame * 1e6:8.2f} µs/frame  x{baseline / per_frame:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""起動時間のベンチマーク（import の時間と、最初の判定までの時間）
+
+使い方: python bench_startup.py [--runs 5] [--source video.mp4]
+それぞれ新しい Python プロセスで計測する（import のキャッシュが効かないように）。
+--source を渡すと、その動画で最初の判定（last_gaze_info が入るまで）の時間を
+モデルの読み込みとカメラのオープンを並行した場合と順番の場合とで比べる。
+"""
+import argparse, json, statistics, subprocess, sys
+
+# import だけの計測（mediapipe は含まれないはず。比較用に単体でも測る）
+IMPORT_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - t0
+print(json.dumps({'import_s': elapsed, 'mediapipe_loaded': 'mediapipe' in sys.modules}))
+"""
+
+# 起動から最初の判定まで
+DECISION_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+import eyeDetection
+t_import = time.perf_counter() - t0
+monitor, cap, timings = eyeDetection.start_monitor(sys.argv[1], overlap=sys.argv[2] == "1")
+frames = 0
+while monitor.last_gaze_info is None:
+    ret, frame = cap.read()
+    if not ret:
+        break
+    monitor.monitor(frame)
+    frames += 1
+timings.update(import_s=t_import, first_decision_s=time.perf_counter() - t0, frames=frames,
+               decided=monitor.last_gaze_info is not None)
+cap.release()
+print(json.dumps(timings))
+"""
+
+MODULES = ["eyeDetection", "eyeSettingsControl", "mediapipe"]
+
+
+def run(snippet, *args):
+    """新しいプロセスで実行して最後の行の JSON を返す（失敗したらエラー文字列）"""
+    proc = subprocess.run([sys.executable, "-c", snippet, *args],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return lines[-1] if lines else "exit %d" % proc.returncode
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def median_of(results, key):
+    return statistics.median(r[key] for r in results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--source", help="最初の判定までを計測する動画ファイル")
+    args = parser.parse_args(argv)
+
+    print(f"=== import（{args.runs} 回の中央値） ===")
+    for module in MODULES:
+        results = [run(IMPORT_SNIPPET, module) for _ in range(args.runs)]
+        errors = [r for r in results if isinstance(r, str)]
+        if errors:
+            print(f"{module:>20}: 失敗 ({errors[0]})")
+            continue
+        note = "（mediapipe を読み込む）" if any(r['mediapipe_loaded'] for r in results) else ""
+        print(f"{module:>20}: {median_of(results, 'import_s') * 1000:8.1f} ms {note}")
+
+    if not args.source:
+        return
+
+    print()
+    print(f"=== 最初の判定まで（{args.runs} 回の中央値） ===")
+    for name, overlap in (("並行", "1"), ("順番", "0")):
+        results = [run(DECISION_SNIPPET, args.source, overlap) for _ in range(args.runs)]
+        errors = [r for r in results if isinstance(r, str)]
+        if errors:
+            print(f"{name}: 失敗 ({errors[0]})")
+            continue
+        parts = "  ".join(f"{key} {median_of(results, key) * 1000:7.1f} ms"
+                          for key in ("import_s", "camera_s", "model_s", "ready_s", "first_decision_s"))
+        undecided = sum(not r['decided'] for r in results)
+        note = f"（{undecided} 回は判定なし）" if undecided else ""
+        print(f"{name}: {parts}{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import getpass, json, os, re
+
+import numpy as np
+
+# 保存先（ユーザー・カメラごとに1ファイル）
+CALIBRATION_DIR = os.path.join(os.path.expanduser("~"), ".eyeSettings", "calibration")
+
+# 旧実装（convert_eye_to_screen）の固定範囲（640x480 のカメラ座標）
+LEGACY_FRAME = (640, 480)
+LEGACY_EYE_X = (180, 430)
+LEGACY_EYE_Y = (130, 300)
+
+
+def poly_features(xy, degree):
+    """(N, 2) の座標 → (N, K) の多項式の項（1, x, y, xy, x², y², ...）"""
+    x, y = xy[:, 0], xy[:, 1]
+    terms = [np.ones_like(x)]
+    for d in range(1, degree + 1):
+        for i in range(d + 1):
+            terms.append(x ** (d - i) * y ** i)
+    return np.stack(terms, axis=1)
+
+
+class Calibration:
+    """カメラ上の目の位置（正規化座標）→ 画面上の位置（正規化座標）の多項式写像
+
+    係数は (2, K) の行列1つで、変換は多項式の項を作って行列を掛けるだけ
+    （何点でもまとめてベクトル演算できる）。画面座標も 0〜1 なので、解像度が
+    変わっても使える。
+    """
+
+    def __init__(self, coeffs, degree=2, rms=None):
+        self.coeffs = np.asarray(coeffs, dtype=np.float64)
+        self.degree = degree
+        self.rms = rms          # フィット時の誤差（画面の正規化座標）
+        # 1点ずつの変換用（毎フレーム NumPy 配列を作らずに済むよう Python の float で持つ）
+        self._rows = self.coeffs.tolist()
+
+    @classmethod
+    def fit(cls, eye_points, screen_points, degree=2):
+        """最小二乗でフィット。点が項の数より少なければ次数を下げる"""
+        eye = np.asarray(eye_points, dtype=np.float64)
+        screen = np.asarray(screen_points, dtype=np.float64)
+        while degree > 1 and len(eye) < poly_features(eye[:1], degree).shape[1]:
+            degree -= 1
+        features = poly_features(eye, degree)
+        coeffs, *_ = np.linalg.lstsq(features, screen, rcond=None)
+        residual = features @ coeffs - screen
+        rms = float(np.sqrt((residual ** 2).sum(axis=1).mean()))
+        return cls(coeffs.T, degree, rms)
+
+    @classmethod
+    def legacy(cls):
+        """旧実装の固定範囲と同じ線形写像"""
+        (x0, x1), (y0, y1) = LEGACY_EYE_X, LEGACY_EYE_Y
+        w, h = LEGACY_FRAME
+        # screen_x = (eye_x * w - x0) / (x1 - x0)
+        coeffs = [[-x0 / (x1 - x0), w / (x1 - x0), 0.0],
+                  [-y0 / (y1 - y0), 0.0, h / (y1 - y0)]]
+        return cls(coeffs, degree=1)
+
+    def apply(self, eye_points):
+        """(N, 2) の正規化カメラ座標 → (N, 2) の正規化画面座標（0〜1 に収める）"""
+        eye = np.asarray(eye_points, dtype=np.float64).reshape(-1, 2)
+        return np.clip(poly_features(eye, self.degree) @ self.coeffs.T, 0.0, 1.0)
+
+    def to_screen(self, x_norm, y_norm, screen_size):
+        """1点を画面のピクセル座標に"""
+        terms = [1.0]
+        for d in range(1, self.degree + 1):
+            for i in range(d + 1):
+                terms.append(x_norm ** (d - i) * y_norm ** i)
+        sx, sy = (min(1.0, max(0.0, sum(c * t for c, t in zip(row, terms)))) for row in self._rows)
+        return int(sx * screen_size[0]), int(sy * screen_size[1])
+
+    # ---- 保存 ----
+    def to_dict(self):
+        return {'degree': self.degree, 'coeffs': self.coeffs.tolist(), 'rms': self.rms}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["coeffs"], data["degree"], data.get("rms"))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def calibration_path(camera=0, user=None, directory=CALIBRATION_DIR):
+    """ユーザーとカメラごとの保存先"""
+    user = user or getpass.getuser()
+    name = re.sub(r"[^\w.-]", "_", "%s-camera%s" % (user, camera))
+    return os.path.join(directory, name + ".json")
+
+
+def load_calibration(path):
+    """保存済みのキャリブレーション（なければ None）"""
+    if not os.path.exists(path):
+        return None
+    return Calibration.load(path)
+
+
+def grid_targets(n=3, margin=0.1):
+    """画面上の目標点（正規化座標）を n x n の格子で"""
+    steps = np.linspace(margin, 1.0 - margin, n)
+    return [(float(x), float(y)) for y in steps for x in steps]
+
+
+class CalibrationSession:
+    """画面上の目標点を順に見てもらい、目の位置を集める
+
+    add_sample() は推論スレッドから呼ぶ。目標が変わってから settle 秒は
+    視線の移動中として捨て、samples 個集まったら次の目標に進む。
+    UI スレッドは target / finished を読んで表示するだけ。
+    """
+
+    def __init__(self, targets=None, samples=20, settle=0.8):
+        self.targets = targets or grid_targets()
+        self.samples = samples
+        self.settle = settle
+        self.index = 0
+        self.collected = [[] for _ in self.targets]
+        self._start = None
+
+    @property
+    def finished(self):
+        return self.index >= len(self.targets)
+
+    @property
+    def target(self):
+        return None if self.finished else self.targets[self.index]
+
+    def add_sample(self, t, x_norm, y_norm):
+        if self.finished:
+            return
+        if self._start is None:
+            self._start = t
+        if t - self._start < self.settle:
+            return
+        bucket = self.collected[self.index]
+        bucket.append((x_norm, y_norm))
+        if len(bucket) >= self.samples:
+            self.index += 1
+            self._start = None
+
+    def fit(self, degree=2):
+        """目標点ごとの中央値でフィット"""
+        eye = [np.median(np.asarray(b), axis=0) for b in self.collected if b]
+        screen = [t for t, b in zip(self.targets, self.collected) if b]
+        return Calibration.fit(eye, screen, degree)
@@ -0,0 +1,76 @@
+from PIL import Image
+
+from rects import clip, union
+
+WHITE = (255, 255, 255, 255)
+CLEAR = (0, 0, 0, 0)
+
+
+def _pixels(layer):
+    """表示に使う画素（読み込み中の仮表示があればそちら。レイヤーの画像には書き込まない）"""
+    return layer.preview if layer.preview is not None else layer.image
+
+
+class LayerCompositor:
+    """レイヤーの合成結果（白背景）を1枚保持し、変更のあった矩形だけ再合成する
+
+    アクティブレイヤーより下（白背景込み）と上の合成結果をそれぞれキャッシュしておき、
+    再合成は「下のキャッシュ + アクティブレイヤー + 上のキャッシュ」の最大3枚で行う。
+    キャッシュはレイヤー構成かアクティブレイヤーが変わったとき、または
+    invalidate() で範囲を指定されたときだけ作り直す。
+    """
+
+    def __init__(self, w, h):
+        self.w, self.h = w, h
+        self.merged = Image.new("RGBA", (w, h), WHITE)
+        self.below = Image.new("RGBA", (w, h), WHITE)
+        self.above = Image.new("RGBA", (w, h), CLEAR)
+        self.has_above = False
+        self._layers = None     # キャッシュを作ったときのレイヤー構成
+        self._active = None
+        self._stale = None      # アクティブ以外のレイヤーが変わった範囲
+
+    def invalidate(self, rect=None):
+        """アクティブ以外のレイヤーも変わった範囲を知らせる（None なら全体）"""
+        if rect is None:
+            self._layers = None
+        else:
+            self._stale = union(self._stale, rect)
+
+    def _rebuild(self, layers, active, rect):
+        """rect の範囲で上下のキャッシュを作り直す"""
+        dest = rect[:2]
+        self.below.paste(WHITE, rect)
+        for layer in layers[:active]:
+            self.below.alpha_composite(_pixels(layer), dest=dest, source=rect)
+        self.above.paste(CLEAR, rect)
+        for layer in layers[active + 1:]:
+            self.above.alpha_composite(_pixels(layer), dest=dest, source=rect)
+
+    def recompose(self, layers, active, rect=None):
+        """rect（None なら全体）を再合成し、実際に再合成した矩形を返す"""
+        full = (0, 0, self.w, self.h)
+        if self._layers != layers or self._active != active:
+            self._layers = list(layers)
+            self._active = active
+            self.has_above = active + 1 < len(layers)
+            self._stale = None
+            self._rebuild(layers, active, full)
+            rect = None
+        elif self._stale is not None:
+            stale = clip(self._stale, self.w, self.h)
+            self._stale = None
+            if stale is not None:
+                self._rebuild(layers, active, stale)
+                rect = union(rect, stale) if rect is not None else None
+
+        rect = clip(rect if rect is not None else full, self.w, self.h)
+        if rect is None:
+            return None
+        dest = rect[:2]
+        self.merged.paste(self.below.crop(rect), dest)
+        if 0 <= active < len(layers):
+            self.merged.alpha_composite(_pixels(layers[active]), dest=dest, source=rect)
+        if self.has_above:
+            self.merged.alpha_composite(self.above, dest=dest, source=rect)
+        return rect
@@ -0,0 +1,247 @@
+import math, sys, threading, time
+
+from settings import DEFAULT_SETTINGS
+
+# ----------------------------
+# フィルター
+# ----------------------------
+def _alpha(cutoff, dt):
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    """One Euro Filter（2次元）
+
+    動きが遅いときは強く平滑化して揺れを抑え、速いときは平滑化を弱めて遅れを減らす。
+    min_cutoff を下げると静止時の揺れが減り、beta を上げると速い動きへの追従が良くなる。
+    平滑化した速度も持つので、少し先の位置の予測に使える。
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.5, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.t = None
+        self.value = None
+        self.velocity = (0.0, 0.0)
+
+    def __call__(self, t, x, y):
+        if self.t is None or t <= self.t:
+            if self.t is None:
+                self.value = (x, y)
+            self.t = t
+            return self.value
+        dt = t - self.t
+        self.t = t
+        px, py = self.value
+        a_d = _alpha(self.d_cutoff, dt)
+        vx = a_d * (x - px) / dt + (1 - a_d) * self.velocity[0]
+        vy = a_d * (y - py) / dt + (1 - a_d) * self.velocity[1]
+        self.velocity = (vx, vy)
+        a = _alpha(self.min_cutoff + self.beta * math.hypot(vx, vy), dt)
+        self.value = (a * x + (1 - a) * px, a * y + (1 - a) * py)
+        return self.value
+
+
+# ----------------------------
+# 出力先
+# ----------------------------
+class QuartzBackend:
+    """macOS: CGEvent でカーソルを動かす。画面サイズは最初に1回だけ問い合わせる"""
+
+    def __init__(self):
+        import Quartz
+        from Quartz.CoreGraphics import CGEventCreateMouseEvent, CGEventPost
+        self.Quartz = Quartz
+        self._create, self._post = CGEventCreateMouseEvent, CGEventPost
+        self._size = None
+
+    def screen_size(self):
+        if self._size is None:
+            screen = self.Quartz.CGDisplayBounds(self.Quartz.CGMainDisplayID())
+            self._size = (int(screen.size.width), int(screen.size.height))
+        return self._size
+
+    def move(self, x, y):
+        event = self._create(None, self.Quartz.kCGEventMouseMoved, (x, y), 0)
+        self._post(self.Quartz.kCGHIDEventTap, event)
+
+
+class PyAutoGuiBackend:
+    """Windows / Linux（X11）: pyautogui でカーソルを動かす"""
+
+    def __init__(self):
+        import pyautogui
+        pyautogui.FAILSAFE = False
+        self.pyautogui = pyautogui
+        self._size = tuple(pyautogui.size())
+
+    def screen_size(self):
+        return self._size
+
+    def move(self, x, y):
+        self.pyautogui.moveTo(x, y, _pause=False)
+
+
+class RecordingBackend:
+    """カーソルを動かさずに (時刻, x, y) を記録する（テスト・画面のない環境用）"""
+
+    def __init__(self, size=(1920, 1080), clock=time.perf_counter):
+        self.size = size
+        self.clock = clock
+        self.moves = []
+
+    def screen_size(self):
+        return self.size
+
+    def move(self, x, y):
+        self.moves.append((self.clock(), x, y))
+
+
+def default_backend():
+    if sys.platform == "darwin":
+        try:
+            return QuartzBackend()
+        except ImportError:
+            pass
+    try:
+        return PyAutoGuiBackend()
+    except Exception:
+        # pyautogui がない・画面がない → 記録だけ
+        return RecordingBackend()
+
+
+# ----------------------------
+# カーソル制御
+# ----------------------------
+
+class CursorController:
+    """視線位置からカーソルを動かす
+
+    update() はカメラ側のスレッドから推論のたびに呼ぶ（正規化座標とキャプチャ時刻）。
+    One Euro Filter でならした位置と速度を保持し、出力は別スレッドが rate Hz で
+    「今の時刻 + lead 秒」まで外挿した位置に動かす。カメラのフレームレートや
+    推論の遅れにかかわらず、カーソルは表示のレートで滑らかに動く。
+    設定（sensitivity, dead_zone を持つ GazeSettings）は丸ごと差し替える（configure）ので、
+    読む側はロック不要。キャリブレーション（calibration.Calibration）があれば、
+    sensitivity の代わりにその写像で画面座標に変換し、dead_zone は変換後の位置
+    （画面の中心からの割合）に対して判定する。
+    session にキャリブレーション中の CalibrationSession を入れると、目の位置は
+    そちらに渡し、カーソルは動かさない。
+    """
+
+    def __init__(self, backend=None, params=DEFAULT_SETTINGS, rate=60.0,
+                 lead=0.0, max_predict=0.1, hold_timeout=0.5, clock=time.perf_counter,
+                 min_cutoff=1.0, beta=10.0):
+        self.backend = backend or default_backend()
+        self.params = params
+        self.rate = rate
+        self.lead = lead                    # 追加で先読みする秒数
+        self.max_predict = max_predict      # 外挿の上限（秒）
+        self.hold_timeout = hold_timeout    # これ以上更新がなければ動かさない
+        self.clock = clock
+        # 正規化座標の速度は 1/秒 未満なので beta は大きめ（遅れ 1/4 程度、静止時の揺れはほぼ同じ）
+        self.filter = OneEuroFilter(min_cutoff, beta)
+        self.state = None                   # (時刻, 位置, 速度)。丸ごと差し替える
+        self.calibration = None
+        self.session = None
+        self.last_position = None
+        self.moves = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def configure(self, params):
+        self.params = params
+
+    def set_calibration(self, calibration):
+        self.calibration = calibration
+
+    def update(self, t, x_norm, y_norm):
+        """推論結果（キャプチャ時刻 t、正規化座標 0〜1）を反映"""
+        session = self.session
+        if session is not None:
+            session.add_sample(t, x_norm, y_norm)
+        value = self.filter(t, x_norm, y_norm)
+        self.state = (t, value, self.filter.velocity)
+
+    def lost(self):
+        """顔を見失った：フィルターを初期化してカーソルを止める"""
+        self.filter.reset()
+        self.state = None
+
+    def predict(self, now):
+        """now 時点の推定位置（正規化座標）。更新が古すぎれば None"""
+        state = self.state
+        if state is None:
+            return None
+        t, (x, y), (vx, vy) = state
+        age = now - t
+        if age > self.hold_timeout:
+            return None
+        ahead = min(max(0.0, age + self.lead), self.max_predict)
+        return x + vx * ahead, y + vy * ahead
+
+    def target(self, position):
+        """正規化座標 → 画面座標（dead_zone 内なら None）"""
+        params = self.params
+        sensitivity, dead_zone = params.sensitivity, params.dead_zone
+        calibration = self.calibration
+        if calibration is not None:
+            width, height = self.backend.screen_size()
+            x, y = calibration.to_screen(*position, (width, height))
+            if abs(x / width - 0.5) < dead_zone and abs(y / height - 0.5) < dead_zone:
+                return None
+            return x, y
+        x_norm, y_norm = position
+        if abs(x_norm - 0.5) < dead_zone and abs(y_norm - 0.5) < dead_zone:
+            return None
+        width, height = self.backend.screen_size()
+        center_x, center_y = width // 2, height // 2
+        dx = (x_norm * width - center_x) * sensitivity / 600.0
+        dy = (y_norm * height - center_y) * sensitivity / 600.0
+        final_x = max(0, min(width, int(center_x + dx)))
+        final_y = max(0, min(height, int(center_y + dy)))
+        return final_x, final_y
+
+    def tick(self, now=None):
+        """1回分の出力。動かしたら画面座標を返す"""
+        if self.session is not None:
+            return None
+        position = self.predict(self.clock() if now is None else now)
+        if position is None:
+            return None
+        target = self.target(position)
+        if target is None or target == self.last_position:
+            return None
+        self.backend.move(*target)
+        self.last_position = target
+        self.moves += 1
+        return target
+
+    # ---- 出力スレッド ----
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        next_time = self.clock()
+        while not self._stop.is_set():
+            self.tick()
+            next_time += interval
+            delay = next_time - self.clock()
+            if delay < 0:
+                # 遅れたら追いつこうとせずに次の周期から
+                next_time = self.clock()
+                delay = 0
+            self._stop.wait(delay)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
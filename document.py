@@ -0,0 +1,254 @@
+"""画像エディタの描画・合成部分（Tk を使わない）
+
+使い方: python document.py ops.json -o out.png [--size 1500x650] [--background image.jpg]
+ops.json は操作のリスト（Document.apply の形式）。画面のないサーバーでも
+視線セッションの注釈画像などをまとめて作れる。
+"""
+import argparse, json
+
+from PIL import Image, ImageDraw
+
+from compositor import LayerCompositor
+from fonts import get_font
+from history import History
+from importer import decode_for_canvas
+from stroke import Stroke
+
+DEFAULT_SIZE = (1500, 650)
+
+
+class Layer:
+    def __init__(self, w, h):
+        # RGBA レイヤー（透明背景）
+        self.image = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+        self.draw = ImageDraw.Draw(self.image)
+        # 画像の読み込み中: 描画・保存はできず、表示だけ preview（仮表示）を使う
+        self.loading = False
+        self.preview = None
+        # 画素を書き換えるたびに増やす（保存時に変わっていないレイヤーを読まずに済む）
+        self.generation = 0
+
+
+class Document:
+    """レイヤー・合成・Undo 履歴をまとめた文書
+
+    描画メソッドはアクティブレイヤーに描き、変わった矩形（画像座標）を返す。
+    描く前に履歴へ変更前のタイルを知らせるので、begin() 〜 commit() の間で
+    呼べば1回の Undo にまとまる。アクティブレイヤーが読み込み中（locked）なら
+    何も描かずに None を返す。
+    """
+
+    def __init__(self, w=DEFAULT_SIZE[0], h=DEFAULT_SIZE[1], layers=None, active=0):
+        self.w, self.h = w, h
+        self.layers = layers if layers is not None else [Layer(w, h)]
+        self.active_layer = active
+        self.compositor = LayerCompositor(w, h)
+        self.history = History()
+
+    @property
+    def active(self):
+        return self.layers[self.active_layer]
+
+    @property
+    def locked(self):
+        """アクティブレイヤーが読み込み中か（読み込みが終わると中身が差し替わる）"""
+        return self.active.loading
+
+    @property
+    def loading(self):
+        """読み込み中のレイヤーがあるか（あいだは保存しない）"""
+        return any(layer.loading for layer in self.layers)
+
+    # ---- 描画 ----
+    def _touch(self, rect):
+        self.history.touch(self.active, rect)
+        self.active.generation += 1
+
+    def stroke(self, stroke, color):
+        """Stroke にたまった点を描く（なければ None）"""
+        if self.locked:
+            return None
+        taken = stroke.take()
+        if taken is None:
+            return None
+        points, dirty = taken
+        self._touch(dirty)
+        stroke.draw(self.active.draw, points, color)
+        return dirty
+
+    def line(self, points, color="black", width=5, smoothing=0.0):
+        """折れ線を1本描く（継ぎ目と端は丸）"""
+        stroke = Stroke(*points[0], width, smoothing)
+        for x, y in points[1:]:
+            stroke.add(x, y)
+        return self.stroke(stroke, color)
+
+    def erase(self, x, y, radius):
+        if self.locked:
+            return None
+        dirty = (x - radius - 1, y - radius - 1, x + radius + 2, y + radius + 2)
+        self._touch(dirty)
+        self.active.draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=(0, 0, 0, 0))
+        return dirty
+
+    def shape(self, kind, x0, y0, x1, y1, outline="black", fill=None, width=2):
+        """kind: "rect" / "oval"。座標の向きは問わない"""
+        if self.locked:
+            return None
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        dirty = (x0 - width, y0 - width, x1 + width + 1, y1 + width + 1)
+        self._touch(dirty)
+        draw = self.active.draw
+        fn = draw.rectangle if kind == "rect" else draw.ellipse
+        if fill:
+            fn([x0, y0, x1, y1], outline=outline, fill=fill, width=width)
+        else:
+            fn([x0, y0, x1, y1], outline=outline, width=width)
+        return dirty
+
+    def text(self, x, y, text, color="black", font=None):
+        if self.locked:
+            return None
+        font = font or get_font()
+        draw = self.active.draw
+        x0, y0, x1, y1 = draw.textbbox((x, y), text, font=font)
+        dirty = (x0 - 1, y0 - 1, x1 + 1, y1 + 1)
+        self._touch(dirty)
+        draw.text((x, y), text, fill=color, font=font)
+        return dirty
+
+    def add_layer(self, layer=None):
+        """レイヤーを一番上に追加してアクティブにする（合成は全体を作り直す → None）"""
+        layer = layer or Layer(self.w, self.h)
+        self.layers.append(layer)
+        self.active_layer = len(self.layers) - 1
+        self.history.layer_added(layer, self.active_layer)
+        return None
+
+    # ---- Undo / Redo ----
+    def undo(self):
+        """戻り値: 変わった矩形 / None（レイヤー構成の変更）/ False（何もしていない）"""
+        self.history.commit()
+        return self._after_history(self.history.undo(self.layers))
+
+    def redo(self):
+        self.history.commit()
+        return self._after_history(self.history.redo(self.layers))
+
+    def _after_history(self, rect):
+        if rect is None:
+            self.active_layer = min(self.active_layer, len(self.layers) - 1)
+        elif rect is not False:
+            # Undo はアクティブ以外のレイヤーも戻すことがある
+            self.compositor.invalidate(rect)
+        return rect
+
+    # ---- 合成 ----
+    def recompose(self, rect=None):
+        """rect（None なら全体）を合成し直し、実際に合成した矩形を返す"""
+        return self.compositor.recompose(self.layers, self.active_layer, rect)
+
+    @property
+    def merged(self):
+        """合成結果（共有している画像なので書き換えないこと）"""
+        return self.compositor.merged
+
+    def render(self):
+        """全体を合成した画像（コピー）"""
+        self.recompose()
+        return self.merged.copy()
+
+    def save_png(self, path):
+        self.render().save(path)
+
+    # ---- 操作の再生 ----
+    def apply(self, op):
+        """操作1つ（dict）を1回の Undo 単位として実行し、変わった矩形を返す
+
+        {"op": "line", "points": [[x, y], ...], "color": "red", "width": 5, "smoothing": 0}
+        {"op": "erase", "x": 10, "y": 10, "radius": 5}
+        {"op": "rect" / "oval", "box": [x0, y0, x1, y1], "outline": "black", "fill": null, "width": 2}
+        {"op": "text", "x": 10, "y": 10, "text": "...", "color": "black", "size": 20, "font": "フォント名 or パス"}
+        {"op": "layer"}                 新しいレイヤー
+        {"op": "image", "path": "..."}  画像を読み込んで新しいレイヤーに
+        {"op": "select", "layer": 0}    アクティブレイヤーの切り替え
+        {"op": "undo"} / {"op": "redo"}
+        """
+        kind = op["op"]
+        if kind == "undo":
+            return self.undo()
+        if kind == "redo":
+            return self.redo()
+        if kind == "select":
+            index = op["layer"]
+            if not isinstance(index, int) or not 0 <= index < len(self.layers):
+                raise ValueError("レイヤー番号が範囲外です: %r（レイヤー数 %d）"
+                                 % (index, len(self.layers)))
+            self.active_layer = index
+            return None
+        if kind == "layer":
+            return self.add_layer()
+        if kind == "image":
+            layer = Layer(self.w, self.h)
+            layer.image = decode_for_canvas(op["path"], (self.w, self.h))
+            layer.draw = ImageDraw.Draw(layer.image)
+            return self.add_layer(layer)
+
+        self.history.begin()
+        if kind == "line":
+            rect = self.line([tuple(p) for p in op["points"]], op.get("color", "black"),
+                             op.get("width", 5), op.get("smoothing", 0.0))
+        elif kind == "erase":
+            rect = self.erase(op["x"], op["y"], op.get("radius", 5))
+        elif kind in ("rect", "oval"):
+            rect = self.shape(kind, *op["box"], outline=op.get("outline", "black"),
+                              fill=op.get("fill"), width=op.get("width", 2))
+        elif kind == "text":
+            font = get_font(op.get("font"), op.get("size", 20))
+            rect = self.text(op["x"], op["y"], op["text"], op.get("color", "black"), font)
+        else:
+            raise ValueError("不明な操作: %r" % kind)
+        self.history.commit()
+        return rect
+
+    def replay(self, ops, redraw=True):
+        """操作を順に実行する。redraw なら操作ごとに変わった範囲を合成し直す"""
+        for op in ops:
+            rect = self.apply(op)
+            if redraw and rect is not False:
+                self.recompose(rect)
+
+
+def load_ops(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    # {"ops": [...]} の形でもよい
+    return data["ops"] if isinstance(data, dict) else data
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="操作リスト（JSON）を描画して PNG に保存")
+    parser.add_argument("ops", help="操作リストの JSON ファイル")
+    parser.add_argument("-o", "--output", required=True, help="出力 PNG")
+    parser.add_argument("--size", type=parse_size, default=DEFAULT_SIZE, help="幅x高さ（既定 1500x650）")
+    parser.add_argument("--background", default=None, help="一番下のレイヤーに読み込む画像")
+    args = parser.parse_args(argv)
+
+    doc = Document(*args.size)
+    if args.background:
+        # 背景は一番下のレイヤーに、操作はその上のレイヤーに描く
+        doc.active.image.paste(decode_for_canvas(args.background, args.size))
+        doc.add_layer()
+    doc.replay(load_ops(args.ops), redraw=False)
+    doc.save_png(args.output)
+    print("保存しました:", args.output)
+
+
+if __name__ == "__main__":
+    main()
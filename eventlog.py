@@ -0,0 +1,95 @@
+import json, logging, queue, sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = "gaze"
+
+# 設定されていなければ何も出さない（logging の lastResort に流さない）
+logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+
+
+class JsonFormatter(logging.Formatter):
+    """1イベント1行の JSON"""
+
+    def format(self, record):
+        event = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'event': record.getMessage(),
+        }
+        event.update(getattr(record, "fields", {}))
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def configure_event_log(path=None, level="INFO"):
+    """イベントログの出力先を設定し、書き込み用の QueueListener を返す
+
+    ログ呼び出し側は QueueHandler でキューに積むだけで、整形とファイル書き込みは
+    QueueListener のスレッドで行う。終了時に listener.stop() を呼ぶこと。
+    """
+    if path:
+        target = logging.FileHandler(path, encoding="utf-8")
+    else:
+        target = logging.StreamHandler(sys.stderr)
+    target.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, target)
+    listener.start()
+    return listener
+
+
+def add_log_arguments(parser):
+    """イベントログ関連のコマンドライン引数を追加"""
+    parser.add_argument("--log-file", default=None,
+                        help="イベントログ（JSONL）の出力先（省略時は標準エラー）")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING"],
+                        help="DEBUG でフレームごとの詳細、INFO で状態遷移・通知・定期サマリー")
+
+
+class EventLog:
+    """視線モニターの構造化イベントログ
+
+    状態遷移・通知・定期サマリーだけを INFO で記録する。フレームごとの詳細は
+    DEBUG で、レベルが無効なら引数の組み立て前に判定して捨てる。
+    """
+
+    def __init__(self, name=LOGGER_NAME, summary_interval=60.0):
+        self.logger = logging.getLogger(name)
+        self.summary_interval = summary_interval
+        self.next_summary = None
+
+    def _log(self, level, event, fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, extra={'fields': fields})
+
+    @property
+    def debug_enabled(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def transition(self, previous, current, **fields):
+        self._log(logging.INFO, "transition", dict(fields, previous=previous, current=current))
+
+    def notification(self, count, **fields):
+        self._log(logging.INFO, "notification", dict(fields, count=count))
+
+    def maybe_summary(self, now, stats):
+        """summary_interval 秒ごとにサマリーを記録する。stats は dict を返す関数"""
+        if self.next_summary is None:
+            self.next_summary = now + self.summary_interval
+            return
+        if now < self.next_summary:
+            return
+        self.next_summary = now + self.summary_interval
+        self._log(logging.INFO, "summary", stats())
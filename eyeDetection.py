@@ -1,8 +1,17 @@
-import cv2, time
-import mediapipe as mp
+import cv2, time, argparse
 import numpy as np
 import subprocess
 
+from facemesh import create_face_mesh, FaceMeshLoader
+from landmarks import LandmarkArray, LEFT_IRIS, RIGHT_IRIS, IRIS_ROWS, screen_gaze
+from roi import FaceRoiTracker, FACE_BOUND_ROWS, run_face_mesh_all
+from faces import (MultiLandmarkArray, FaceTracker, FaceStates, DIRECTIONS, CENTER,
+                   screen_gazes, classify_directions)
+from scheduler import AdaptiveScheduler
+from notification import AsyncNotifier
+from profiling import NULL_PROFILER, add_metrics_arguments, profiler_from_args, finish_profiler
+from eventlog import EventLog, add_log_arguments, configure_event_log
+
 class SystemNotifier:
 
     @staticmethod
@@ -208,90 +217,197 @@ class GazeMonitorWithNotification:
                  gaze_threshold=0.2,  # 目線ずれの閾値（調整可能）
                  distraction_time=5.0,  # 何秒同じであれば通知するか
                  cooldown_time=60.0,    # 通知間隔
-                 fps=30):
-
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+                 fps=30,
+                 notifier=None,         # 通知クラス（None ならバックグラウンド送信の AsyncNotifier）
+                 clock=time.time,       # 現在時刻を返す関数（リプレイ時は動画時刻）
+                 use_roi=True,          # 前フレームの顔周辺だけ切り出して推論する
+                 adaptive_rate=True,    # 視線が安定している間は推論を間引く
+                 face_mesh=None,        # 既存の FaceMesh を使い回す場合に渡す
+                 profiler=None,         # ステージ別の処理時間を計測する StageProfiler
+                 summary_interval=60.0,   # 統計サマリーをログに出す間隔（秒）
+                 max_faces=1):          # 同時に追跡する人数（2 以上で顔ごとに状態を持つ）
+
+        self.face_mesh = face_mesh if face_mesh is not None else create_face_mesh(max_faces)
+        self.max_faces = max_faces
 
         self.fps = fps
+        self.distraction_time = distraction_time
         self.distracted_threshold = int(distraction_time * fps)
-        self.LEFT_IRIS = [474, 475, 476, 477]
-        self.RIGHT_IRIS = [469, 470, 471, 472]
+        self.LEFT_IRIS = LEFT_IRIS
+        self.RIGHT_IRIS = RIGHT_IRIS
+        self.landmarks = LandmarkArray()
+        # ROI は1人の顔の周りを切り出すので、複数人のときは常にフレーム全体で推論する
+        self.roi = FaceRoiTracker(enabled=use_roi and max_faces == 1)
+        # 複数人: ID の対応づけと顔ごとの状態（枠番号で引く配列）
+        self.tracker = None
+        if max_faces > 1:
+            self.tracker = FaceTracker(max_faces)
+            self.face_points = MultiLandmarkArray(max_faces)
+            self.face_states = FaceStates(max_faces)
         
         # 目線ずれの監視設定
         self.distracted_frames = 0
-        self.last_notification_time = 0
+        self.last_notification_time = float("-inf")
         self.notification_cooldown = 10  # 10秒のクールダウン
         self.notification_count = 0
         # 状態管理
         self.distracted_frames = 0
-        self.last_notification_time = 0
+        self.last_notification_time = float("-inf")
         self.last_direction = "CENTER"
+        self.direction_since = None     # 現在の方向になった時刻（clock 基準）
+        self.skipped_frames = 0
+        self.scheduler = AdaptiveScheduler(max_fps=fps) if adaptive_rate else None
         # 統計情報
         self.total_frames = 0
         self.focused_frames = 0
-        self.notifier = SystemNotifier()
-
-        print(f"=== 初期設定 ===")
-        print(f"目線ずれ閾値: {gaze_threshold}")
-        print(f"通知までの時間: {distraction_time}秒")
-        print(f"通知間隔: {cooldown_time}秒")
-        print("================")
-
-    def detect_gaze(self, frame):
-        """視線検出"""
+        self.last_gaze_info = None
+        # 通知の送信（osascript など）でフレームループを止めないよう非同期で送る
+        self.notifier = notifier if notifier is not None else AsyncNotifier()
+        self.clock = clock
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        # フレームごとの print はせず、状態遷移・通知・定期サマリーだけ記録する
+        self.events = EventLog(summary_interval=summary_interval)
+
+        self.events.info("config",
+                         gaze_threshold=gaze_threshold,
+                         distraction_time=distraction_time,
+                         cooldown_time=cooldown_time)
+
+    def estimate_gaze(self, frame):
+        """視線推定（描画なし）。顔が見つからなければ None"""
+        if self.tracker is not None:
+            return self.estimate_faces(frame)
         h, w = frame.shape[:2]
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.face_mesh.process(rgb)
-
-        if not results.multi_face_landmarks:
-            return None, frame
-
-        landmarks = results.multi_face_landmarks[0].landmark
-
-        # 虹彩中心を取得
-        left_iris = np.mean([
-            [landmarks[i].x * w, landmarks[i].y * h] 
-            for i in self.LEFT_IRIS
-        ], axis=0).astype(int)
+        found = self.roi.process(frame, self.face_mesh, self.profiler)
+        if found is None:
+            return None
 
-        right_iris = np.mean([
-            [landmarks[i].x * w, landmarks[i].y * h] 
-            for i in self.RIGHT_IRIS
-        ], axis=0).astype(int)
+        with self.profiler.stage("landmarks"):
+            # 虹彩と顔の端のランドマークだけ元フレームの座標で配列に変換
+            landmarks, (x0, y0, crop_w, crop_h) = found
+            self.landmarks.fill(landmarks, crop_w, crop_h,
+                                rows=IRIS_ROWS + FACE_BOUND_ROWS, offset=(x0, y0))
+            self.roi.update(self.landmarks.points[FACE_BOUND_ROWS])
 
-        eyes_center = ((left_iris + right_iris) / 2).astype(int)
-        screen_center = np.array([w // 2, h // 2])
-        gaze_vector = eyes_center - screen_center
-
-        gaze_x = gaze_vector[0] / (w // 2)
-        gaze_y = gaze_vector[1] / (h // 2)
+            left_iris, right_iris, eyes_center, gaze_x, gaze_y = screen_gaze(
+                self.landmarks.iris_centers(), w, h)
 
         direction = self._classify_direction(gaze_x, gaze_y)
         is_focused = direction == "CENTER"
 
-        # 描画
-        annotated = self._draw_gaze(frame, left_iris, right_iris, 
-                                     eyes_center, direction, is_focused)
-
         return {
             'direction': direction,
             'is_focused': is_focused,
             'gaze_x': gaze_x,
             'gaze_y': gaze_y,
-        }, annotated
+            'left_iris': left_iris,
+            'right_iris': right_iris,
+            'eyes_center': eyes_center,
+        }
+
+    def estimate_faces(self, frame):
+        """複数人の視線推定（描画なし）。顔が見つからなければ None
+
+        全員分を配列でまとめて計算し、'faces' に顔ごとの配列（枠番号・ID・方向コード・
+        視線のずれ・虹彩・両目の中点）を入れる。それ以外のキーは代表の顔
+        （いちばん長く追跡している = ID が最小の顔）の値で、1人のときと同じ形。
+        """
+        h, w = frame.shape[:2]
+        faces = run_face_mesh_all(self.face_mesh, frame, self.profiler)
+        with self.profiler.stage("landmarks"):
+            n = self.face_points.fill(faces, w, h, rows=IRIS_ROWS + FACE_BOUND_ROWS)
+            slots = self.tracker.associate(self.face_points.bounds())
+            if n == 0:
+                return None
+            iris, eyes_center, gaze = screen_gazes(self.face_points.iris_centers(), w, h)
+            directions = classify_directions(gaze)
+
+        ids = self.tracker.ids[slots]
+        p = int(np.argmin(ids))
+        direction = DIRECTIONS[directions[p]]
+        return {
+            'direction': direction,
+            'is_focused': direction == "CENTER",
+            'gaze_x': gaze[p, 0],
+            'gaze_y': gaze[p, 1],
+            'left_iris': iris[p, 0],
+            'right_iris': iris[p, 1],
+            'eyes_center': eyes_center[p],
+            'faces': {
+                'slots': slots,
+                'ids': ids,
+                'directions': directions,
+                'gaze': gaze,
+                'iris': iris,
+                'eyes_center': eyes_center,
+            },
+        }
+
+    def detect_gaze(self, frame):
+        """視線検出"""
+        gaze_info = self.estimate_gaze(frame)
+        if gaze_info is None:
+            return None, frame
+
+        # 描画
+        annotated = self._draw_gaze(frame, gaze_info['left_iris'], gaze_info['right_iris'],
+                                     gaze_info['eyes_center'], gaze_info['direction'],
+                                     gaze_info['is_focused'])
+        return gaze_info, annotated
 
     def monitor(self, frame):
         """目線監視とアクション実行"""
-        gaze_info, annotated = self.detect_gaze(frame)
-
+        self.profiler.frame()
+        with self.profiler.stage("frame"):
+            now = self.clock()
+            if self.scheduler is not None and not self.scheduler.due(now):
+                # 推論を間引いたフレームは直前の結果を描画するだけ
+                self.skip()
+                return self.annotate(frame, self.last_gaze_info)
+
+            gaze_info = self.estimate_gaze(frame)
+            with self.profiler.stage("update"):
+                self.update(gaze_info)
+            self.observe(now, gaze_info)
+            return self.annotate(frame, gaze_info)
+
+    def observe(self, now, gaze_info):
+        """推論結果をスケジューラに渡して次の推論時刻を決める"""
+        if self.scheduler is None:
+            return
         if gaze_info:
-            self.total_frames += 1
+            state = gaze_info['direction']
+            if 'faces' in gaze_info:
+                # 誰か1人でも方向が変わるか、人が入れ替わったらすぐ元のレートに戻す
+                faces = gaze_info['faces']
+                state = (faces['ids'].tobytes(), faces['directions'].tobytes())
+            self.scheduler.observe(now, state, (gaze_info['gaze_x'], gaze_info['gaze_y']))
+        else:
+            self.scheduler.observe(now)
+
+    def annotate(self, frame, gaze_info):
+        """推定結果と統計を描画（パイプラインの描画ステージ用）"""
+        if not gaze_info:
+            return frame
+        with self.profiler.stage("draw_gaze"):
+            if 'faces' in gaze_info:
+                annotated = self._draw_faces(frame, gaze_info['faces'])
+            else:
+                annotated = self._draw_gaze(frame, gaze_info['left_iris'], gaze_info['right_iris'],
+                                             gaze_info['eyes_center'], gaze_info['direction'],
+                                             gaze_info['is_focused'])
+        with self.profiler.stage("put_text"):
+            self._draw_stats(annotated)
+        return annotated
+
+    def update(self, gaze_info):
+        """推定結果から状態を更新し、必要なら通知する"""
+        self.last_gaze_info = gaze_info
+        self._count(gaze_info)
+
+        if gaze_info and 'faces' in gaze_info:
+            self._update_faces(gaze_info)
+        elif gaze_info:
             direction = gaze_info['direction']
             is_focused = gaze_info['is_focused']
             # if gaze_info['is_focused']:
@@ -301,37 +417,39 @@ class GazeMonitorWithNotification:
             #     self.distracted_frames += 1
 
 
-            distracted_seconds = self.distracted_frames / self.fps
+            # フレームを間引くことがあるので経過時間は時計で測る
+            current_time = self.clock()
 
             # 方向変化があった場合 → カウントリセット
             if direction != self.last_direction:
+                previous = self.last_direction
                 self.distracted_frames = 0
                 self.last_direction = direction
-                print(f"リセット: {direction} | リセット")
+                self.direction_since = current_time
+                self.events.transition(previous, direction, t=current_time)
             else:
                 # 同じ方向が続いている
                 self.distracted_frames += 1
+                if self.direction_since is None:
+                    self.direction_since = current_time
 
-            distracted_seconds = self.distracted_frames / self.fps
-            print(f"is_focused: {is_focused} | 経過: {distracted_seconds:.2f}s")
-            print(f"direction: {direction} | 経過: {self.last_direction}")
-            print(f"2@@distracted_frames: {self.distracted_frames} | distracted_threshold: {int(self.distracted_threshold)}")
-
-            # 集中状態ならフレームを加算
-            if is_focused:
-                self.focused_frames += 1
+            distracted_seconds = current_time - self.direction_since
+            if self.events.debug_enabled:
+                self.events.debug("frame",
+                                  is_focused=is_focused,
+                                  direction=direction,
+                                  distracted_seconds=round(distracted_seconds, 3),
+                                  distracted_frames=self.distracted_frames)
 
             # 同じ方向が一定時間続いたら通知（ただし10分に1回まで）
             if (is_focused == True and 
-                int(self.distracted_frames) >= int(self.distracted_threshold)):
-                print(f": {self.distracted_frames} | self.distracted_threshold: {self.distracted_threshold}")
-
-                current_time = time.time()
+                distracted_seconds >= self.distraction_time):
                 if current_time - self.last_notification_time > self.notification_cooldown:
                     self._send_notification()
-                    print("¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥¥")
                     self.last_notification_time = current_time
 
+            self.events.maybe_summary(current_time, self.stats)
+
             # # 目線が同じである場合
             # if self.distracted_frames >= self.distracted_threshold:
             #     current_time = time.time()
@@ -345,18 +463,83 @@ class GazeMonitorWithNotification:
             #         self.last_notification_time = current_time
             #         self.distracted_frames = 0  # リセット
 
-            # 統計情報を表示
-            focus_rate = (self.focused_frames / self.total_frames * 100) if self.total_frames > 0 else 0
-            cv2.putText(annotated, f"Focus Rate: {focus_rate:.1f}%", 
-                       (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-            # 警告表示
-            # if self.distracted_frames > 30:
-            #     remaining = self.distracted_threshold - self.distracted_frames
-            #     cv2.putText(annotated, f"Warning in: {remaining // 30}s", 
-            #                (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
-        return annotated
+    def skip(self):
+        """推論を間引いたフレーム：直前の結果が続いているとみなして統計に数える
+
+        数えないと、安定して CENTER を見ている間ほど推論が減るので
+        Focus Rate が実際より低くなる（間引きの有無で値が変わる）。
+        """
+        self.skipped_frames += 1
+        gaze_info = self.last_gaze_info
+        self._count(gaze_info)
+        if gaze_info and 'faces' in gaze_info:
+            faces = gaze_info['faces']
+            self.face_states.count(faces['slots'], faces['ids'], faces['directions'])
+
+    def _count(self, gaze_info):
+        """1フレーム分の統計（Focus Rate 用）を数える
+
+        複数人のときは写っている全員分を足す（顔×フレームの数。Focus Rate は全員の平均）。
+        """
+        if not gaze_info:
+            return
+        if 'faces' in gaze_info:
+            directions = gaze_info['faces']['directions']
+            self.total_frames += len(directions)
+            self.focused_frames += int(np.count_nonzero(directions == CENTER))
+            return
+        self.total_frames += 1
+        if gaze_info['is_focused']:
+            self.focused_frames += 1
+
+    def _update_faces(self, gaze_info):
+        """複数人: 顔ごとの状態をまとめて更新し、該当する人ごとに通知する
+
+        全体の total_frames / focused_frames は _count で全員分を数える。
+        """
+        current_time = self.clock()
+        faces = gaze_info['faces']
+        self.last_direction = gaze_info['direction']
+
+        ids, directions = faces['ids'], faces['directions']
+        previous, changed, due = self.face_states.update(
+            faces['slots'], ids, directions, current_time,
+            self.distraction_time, self.notification_cooldown)
+        # 方向の変化と通知はまれなので、該当する顔だけ Python で回す
+        for i in np.flatnonzero(changed):
+            self.events.transition(DIRECTIONS[previous[i]], DIRECTIONS[directions[i]],
+                                   t=current_time, face=int(ids[i]))
+        for i in np.flatnonzero(due):
+            self._send_notification(face=int(ids[i]), direction=DIRECTIONS[directions[i]])
+
+        self.events.maybe_summary(current_time, self.stats)
+
+    def stats(self):
+        """統計情報（定期サマリー用）"""
+        stats = {
+            'total_frames': self.total_frames,
+            'focused_frames': self.focused_frames,
+            'focus_rate': round(self.focused_frames / self.total_frames * 100, 1)
+                          if self.total_frames > 0 else 0.0,
+            'skipped_frames': self.skipped_frames,
+            'notifications': self.notification_count,
+        }
+        if self.tracker is not None:
+            stats['faces'] = self.face_states.summary(self.tracker.active)
+        return stats
+
+    def _draw_stats(self, annotated):
+        """統計情報を表示"""
+        focus_rate = (self.focused_frames / self.total_frames * 100) if self.total_frames > 0 else 0
+        label = "Focus Rate (all faces)" if self.tracker is not None else "Focus Rate"
+        cv2.putText(annotated, f"{label}: {focus_rate:.1f}%", 
+                   (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+        # 警告表示
+        # if self.distracted_frames > 30:
+        #     remaining = self.distracted_threshold - self.distracted_frames
+        #     cv2.putText(annotated, f"Warning in: {remaining // 30}s", 
+        #                (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
     
     def _classify_direction(self, x, y):
         """視線方向を分類"""
@@ -388,33 +571,99 @@ class GazeMonitorWithNotification:
 
         return annotated
 
-    def _send_notification(self):
-        """通知を送信（複数の方法を試す）"""
+    def _draw_faces(self, frame, faces):
+        """複数人の視線の描画（顔ごとに ID と方向）"""
+        annotated = frame.copy()
+        for face_id, (left_iris, right_iris), eyes_center, code in zip(
+                faces['ids'], faces['iris'], faces['eyes_center'], faces['directions']):
+            cv2.circle(annotated, tuple(left_iris), 3, (0, 255, 0), -1)
+            cv2.circle(annotated, tuple(right_iris), 3, (0, 255, 0), -1)
+            color = (0, 255, 0) if code == CENTER else (0, 0, 255)
+            cv2.circle(annotated, tuple(eyes_center), 5, color, -1)
+            cv2.putText(annotated, f"#{face_id} {DIRECTIONS[code]}",
+                        (int(eyes_center[0]) + 10, int(eyes_center[1]) - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        focused = int(np.count_nonzero(faces['directions'] == CENTER))
+        cv2.putText(annotated, f"Faces: {len(faces['ids'])} (focused {focused})", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        return annotated
+
+    def close(self):
+        """キューに残った通知を送り切る"""
+        close = getattr(self.notifier, "close", None)
+        if close is not None:
+            close()
+
+    def _send_notification(self, face=None, direction=None):
+        """通知を送信（複数の方法を試す）。face: 複数人のときの対象の ID"""
         self.notification_count += 1
+        subtitle = f"{self.notification_count}回目の警告"
+        fields = {}
+        if face is not None:
+            subtitle += f"（#{face}）"
+            fields['face'] = face
         
         # ★方法1: osascript通知（最優先）
         success = self.notifier.notify(
             message="目線がずらしてください！ 画面に視点をタスクスケジュールを再評価してください",
             title="集中力モニター",
-            subtitle=f"{self.notification_count}回目の警告",
+            subtitle=subtitle,
             sound=True
         )
         
         # ★方法2: 音声通知（確実）
         # self.notifier.speak("目線がずらしてください！画面に視点をタスクスケジュールを再評価してください")
         
-        # ★方法3: ターミナルに大きく表示
-        print("\n" + "="*50)
-        print("🚨 警告: 目線がずれています！ 🚨")
-        print(f"通知回数: {self.notification_count}")
-        print("="*50 + "\n")
+        # ★方法3: イベントログに記録
+        self.events.notification(self.notification_count, queued=success,
+                                 direction=direction or self.last_direction, **fields)
 
 # 使用例
-def main():
-    monitor = GazeMonitorWithNotification()
-    cap = cv2.VideoCapture(0)
-    
+def start_monitor(source=0, overlap=True, max_faces=1, **monitor_kwargs):
+    """FaceMesh の準備とカメラのオープンを並行して行う
+
+    戻り値: (monitor, cap, 内訳)。内訳は camera_s（カメラを開く時間）、
+    model_s（mediapipe の読み込み + FaceMesh 作成）、ready_s（全体）。
+    overlap=False なら順番に行う（比較用）。
+    """
+    t0 = time.perf_counter()
+    loader = FaceMeshLoader(max_num_faces=max_faces)
+    if overlap:
+        loader.start()
+    else:
+        loader.load()
+    t_camera = time.perf_counter()
+    cap = cv2.VideoCapture(source)
+    camera_s = time.perf_counter() - t_camera
+    monitor = GazeMonitorWithNotification(face_mesh=loader.get(), max_faces=max_faces,
+                                          **monitor_kwargs)
+    timings = {
+        'camera_s': camera_s,
+        'model_s': loader.elapsed,
+        'ready_s': time.perf_counter() - t0,
+    }
+    return monitor, cap, timings
+
+
+def main(argv=None):
+    t_start = time.perf_counter()
+    parser = argparse.ArgumentParser(description="目線モニター")
+    parser.add_argument("--source", default="0", help="カメラ番号または動画ファイル")
+    parser.add_argument("--max-faces", type=int, default=1,
+                        help="同時に追跡する人数（2 以上で顔ごとに ID を振って判定・通知する）")
+    add_metrics_arguments(parser)
+    add_log_arguments(parser)
+    args = parser.parse_args(argv)
+
+    log_listener = configure_event_log(args.log_file, args.log_level)
+    profiler = profiler_from_args(args)
+    source = int(args.source) if args.source.isdigit() else args.source
+    monitor, cap, startup = start_monitor(source, max_faces=args.max_faces, profiler=profiler)
+    first_decision = None
+
     print("=== 目線モニター開始 ===")
+    print(f"起動: カメラ {startup['camera_s']:.2f}s / モデル {startup['model_s']:.2f}s（並行）")
     print("目線が3秒以上ずれると通知が表示されます")
     print("'q'キーで終了")
     print()
@@ -425,6 +674,10 @@ def main():
             break
 
         annotated = monitor.monitor(frame)
+        if first_decision is None and monitor.last_gaze_info is not None:
+            first_decision = time.perf_counter() - t_start
+            monitor.events.info("startup", first_decision_s=round(first_decision, 3),
+                                **{k: round(v, 3) for k, v in startup.items()})
         cv2.imshow('Gaze Monitor', annotated)
         
         if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -432,13 +685,17 @@ def main():
 
     cap.release()
     cv2.destroyAllWindows()
+    monitor.close()
+    log_listener.stop()
+    finish_profiler(profiler, args)
 
     # 最終統計
     if monitor.total_frames > 0:
         focus_rate = monitor.focused_frames / monitor.total_frames * 100
         print(f"\n=== 統計情報 ===")
-        print(f"総フレーム数: {monitor.total_frames}")
-        print(f"集中フレーム数: {monitor.focused_frames}")
+        unit = "（全員分の顔×フレーム）" if monitor.tracker is not None else ""
+        print(f"総フレーム数: {monitor.total_frames}{unit}")
+        print(f"集中フレーム数: {monitor.focused_frames}{unit}")
         print(f"集中率: {focus_rate:.1f}%")
 
     # detector = GazeDetector()
@@ -1,159 +1,106 @@
+import argparse
 import threading
 import time
-import cv2
-import numpy as np
-import mediapipe as mp
 import tkinter as tk
 from tkinter import ttk
-import Quartz
-import pyautogui
 
-from Quartz.CoreGraphics import (
-    CGEventCreateMouseEvent,
-    CGEventPost,
-    kCGHIDEventTap,
-    kCGEventMouseMoved,
-)
+from calibration import (CalibrationSession, calibration_path,
+                         grid_targets, load_calibration)
+from cursor import CursorController, RecordingBackend
+from facemesh import FaceMeshLoader
+from landmarks import LandmarkArray, IRIS_ROWS
+from pipeline import FrameGrabber
+from roi import FaceRoiTracker, FACE_BOUND_ROWS
+from scheduler import AdaptiveScheduler
+from settings import SettingsChannel
+from profiling import NULL_PROFILER, add_metrics_arguments, profiler_from_args, finish_profiler
 
 # ----------------------------
 # Tkinter 用設定クラス
 # ----------------------------
 class Settings:
-    def __init__(self):
-        self.sensitivity = tk.DoubleVar(value=600.0)  # 画面移動倍率
-        self.dead_zone = tk.DoubleVar(value=0.1)     # 中心停止範囲
-        self.fps = tk.IntVar(value=30)                # 処理FPS
-
-# ----------------------------
-# カーソル移動関数
-# ----------------------------
-def move_cursor_from_gaze(eyes_center, frame, landmarks, settings):
-    """
-    eyes_center: (x, y) カメラ座標
-    frame: カメラフレーム
-    landmarks: 顔ランドマーク
-    settings: Settings クラス（sensitivity, dead_zone）
-    """
-    h, w = frame.shape[:2]
-
-    # 正規化座標 0~1
-    x_norm = eyes_center[0] / w
-    y_norm = eyes_center[1] / h
-
-    # 画面サイズ
-    screen = Quartz.CGDisplayBounds(Quartz.CGMainDisplayID())
-    screen_width = int(screen.size.width)
-    screen_height = int(screen.size.height)
-
-    # 正規化 → 画面座標
-    x_screen = int(x_norm * screen_width)
-    y_screen = int(y_norm * screen_height)
-
-    # dead_zone 設定（画面中央で止める範囲）
-    dead_zone_px_x = int(settings.dead_zone.get() * screen_width)
-    dead_zone_px_y = int(settings.dead_zone.get() * screen_height)
-
-    center_x = screen_width // 2
-    center_y = screen_height // 2
-
-    dx = x_screen - center_x
-    dy = y_screen - center_y
-
-    gaze_x = x_norm - 0.5
-    gaze_y = y_norm - 0.5
-
-    dead_zone = float(settings.dead_zone.get())  # 例: 0.1
-    sensitivity = float(settings.sensitivity.get())  # 例: 700
-    
-    # Dead zone（無視する範囲）
-    if abs(gaze_x) < dead_zone and abs(gaze_y) < dead_zone:
-        return
-    # if abs(dx) < dead_zone_px_x and abs(dy) < dead_zone_px_y:
-    #     return  # dead_zone内は移動しない
-    print("¥¥¥¥¥¥¥2")
-
-    # sensitivity に応じて倍率をかける
-    dx = int(dx * settings.sensitivity.get() / 600.0)
-    dy = int(dy * settings.sensitivity.get() / 600.0)
-
-    final_x = center_x + dx
-    final_y = center_y + dy
-
-    # 画面端制限
-    final_x = max(0, min(screen_width, final_x))
-    final_y = max(0, min(screen_height, final_y))
-    print(final_x)
-
-    # カーソル移動
-    event = CGEventCreateMouseEvent(
-        None,
-        kCGEventMouseMoved,
-        (final_x, final_y),
-        0
-    )
-    CGEventPost(kCGHIDEventTap, event)
-
-
-def convert_eye_to_screen(eye_x, eye_y):
-    screen = Quartz.CGDisplayBounds(Quartz.CGMainDisplayID())
-    screen_width = int(screen.size.width)
-    screen_height = int(screen.size.height)
-    eye_min_x = 180
-    eye_max_x = 430
-    eye_min_y = 130
-    eye_max_y = 300
-
-    # カメラ空間 → スクリーン空間
-    screen_x = map_value(eye_x, eye_min_x, eye_max_x, 0, screen_width)
-    screen_y = map_value(eye_y, eye_min_y, eye_max_y, 0, screen_height)
-
-    # 画面外に出さない
-    screen_x = max(0, min(screen_width, screen_x))
-    screen_y = max(0, min(screen_height, screen_y))
-
-    return int(screen_x), int(screen_y)
-
+    """設定画面の Tk 変数。値が変わるたびに channel へ変更不可のスナップショットを公開する
+    （ワーカースレッドは Tk 変数を読まずに channel.current だけを見る）"""
+
+    def __init__(self, channel=None):
+        self.channel = channel or SettingsChannel()
+        initial = self.channel.current
+        self.sensitivity = tk.DoubleVar(value=initial.sensitivity)  # 画面移動倍率
+        self.dead_zone = tk.DoubleVar(value=initial.dead_zone)      # 中心停止範囲
+        self.fps = tk.IntVar(value=initial.fps)                     # 処理FPS
+        for var in (self.sensitivity, self.dead_zone, self.fps):
+            var.trace_add("write", lambda *_: self.publish())
+
+    def publish(self):
+        try:
+            self.channel.publish(sensitivity=float(self.sensitivity.get()),
+                                 dead_zone=float(self.dead_zone.get()),
+                                 fps=int(self.fps.get()))
+        except tk.TclError:
+            # 入力途中などで数値にならないときは前の値のまま
+            pass
 
 # ----------------------------
 # OpenCV 目線処理ループ
 # ----------------------------
-def gaze_loop(settings, stop_event):
-    cap = cv2.VideoCapture(0)
-    mp_face_mesh = mp.solutions.face_mesh
-    face_mesh = mp_face_mesh.FaceMesh(
-        max_num_faces=1,
-        refine_landmarks=True,
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5
-    )
-
-    LEFT_IRIS = [474, 475, 476, 477]
-    RIGHT_IRIS = [469, 470, 471, 472]
+def gaze_loop(channel, stop_event, cursor, profiler=NULL_PROFILER, camera=0, loader=None):
+    """channel: SettingsChannel（設定はフレームごとに channel.current を1回読むだけ）
+    loader: 起動時に開始した FaceMeshLoader（カメラを開いている間にモデルを準備する）"""
+    loader = loader or FaceMeshLoader().start()
+    # 読み込みは別スレッド（推論中に古いフレームが溜まらないようにする）
+    grabber = FrameGrabber(camera).start()
+    face_mesh = loader.get()
+
+    points = LandmarkArray()
+    roi = FaceRoiTracker()
+    scheduler = AdaptiveScheduler(max_fps=channel.current.fps)
 
     while not stop_event.is_set():
-        ret, frame = cap.read()
-        if not ret:
+        settings = channel.current
+        if settings is not cursor.params:
+            cursor.configure(settings)
+
+        # 視線が安定している間は推論間隔を伸ばす（動いたらすぐ設定 FPS に戻る）
+        scheduler.set_max_fps(settings.fps)
+        if stop_event.wait(scheduler.wait_time(time.monotonic())):
+            break
+
+        item = grabber.read()
+        if item is None:
+            if grabber.frames.closed:
+                # カメラが開けない・映像が終わった → read() はすぐ None を返し続けるので抜ける
+                print("カメラからフレームを取得できません。視線の処理を終了します")
+                cursor.lost()
+                break
             continue
+        _, t_capture, frame = item
+        profiler.frame()
 
-        h, w = frame.shape[:2]
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(rgb)
-
-        if results.multi_face_landmarks:
-            landmarks = results.multi_face_landmarks[0].landmark
+        # 前フレームの顔周辺だけ切り出して推論
+        found = roi.process(frame, face_mesh, profiler)
 
-            # 左右虹彩中心
-            left_iris = np.mean([[landmarks[i].x * w, landmarks[i].y * h] for i in LEFT_IRIS], axis=0)
-            right_iris = np.mean([[landmarks[i].x * w, landmarks[i].y * h] for i in RIGHT_IRIS], axis=0)
+        if found is not None:
+            landmarks, (x0, y0, crop_w, crop_h) = found
 
-            eyes_center = ((left_iris + right_iris) / 2).astype(int)
+            # 左右虹彩中心（元フレームの座標）
+            with profiler.stage("landmarks"):
+                points.fill(landmarks, crop_w, crop_h,
+                            rows=IRIS_ROWS + FACE_BOUND_ROWS, offset=(x0, y0))
+                roi.update(points.points[FACE_BOUND_ROWS])
+                eyes_center = points.iris_centers().mean(axis=0).astype(int)
 
-            # move_cursor に渡す
-            move_cursor_from_gaze(eyes_center, frame, landmarks, settings)
+            # カーソル制御に渡す（実際の移動は出力スレッドが表示レートで行う）
+            h, w = frame.shape[:2]
+            with profiler.stage("cursor"):
+                cursor.update(t_capture, eyes_center[0] / w, eyes_center[1] / h)
 
-        time.sleep(1.0 / settings.fps.get())
+            scheduler.observe(time.monotonic(),
+                              vector=(eyes_center[0] / w - 0.5, eyes_center[1] / h - 0.5))
+        else:
+            cursor.lost()
+            scheduler.observe(time.monotonic())
 
-    cap.release()
+    grabber.stop()
 
 
 def center_window(win, width, height):
@@ -170,14 +117,20 @@ def center_window(win, width, height):
 # ----------------------------
 # 設定ウィンドウ
 # ----------------------------
-def open_settings_window(settings, root):
+def open_settings_window(settings, root, cursor=None):
     win = tk.Toplevel(root)
     win.title("Settings")
     win.geometry("300x200")
 
-    ttk.Label(win, text="Sensitivity").pack(pady=5)
-    ttk.Scale(win, from_=200, to=8000, variable=settings.sensitivity,
-              orient="horizontal").pack(fill="x", padx=20)
+    # キャリブレーション中は写像が位置を決めるので感度は効かない
+    calibrated = cursor is not None and cursor.calibration is not None
+    ttk.Label(win, text="Sensitivity（キャリブレーション使用中は無効）" if calibrated
+              else "Sensitivity").pack(pady=5)
+    sensitivity = ttk.Scale(win, from_=200, to=8000, variable=settings.sensitivity,
+                            orient="horizontal")
+    if calibrated:
+        sensitivity.state(["disabled"])
+    sensitivity.pack(fill="x", padx=20)
 
     ttk.Label(win, text="Dead Zone").pack(pady=5)
     ttk.Scale(win, from_=0.0, to=0.2, variable=settings.dead_zone, orient="horizontal").pack(fill="x", padx=20)
@@ -188,10 +141,67 @@ def open_settings_window(settings, root):
 
     ttk.Button(win, text="Close", command=win.destroy).pack(pady=10)
 
+# ----------------------------
+# キャリブレーション
+# ----------------------------
+def open_calibration_window(root, cursor, path, targets=3):
+    """全画面に目標点を順に表示して目の位置を集め、フィットして保存する（Esc で中止）"""
+    win = tk.Toplevel(root)
+    win.attributes("-fullscreen", True)
+    canvas = tk.Canvas(win, bg="black", highlightthickness=0)
+    canvas.pack(fill="both", expand=True)
+    session = CalibrationSession(grid_targets(targets))
+    cursor.session = session
+
+    def finish(save):
+        cursor.session = None
+        if save:
+            calibration = session.fit()
+            calibration.save(path)
+            cursor.set_calibration(calibration)
+            print(f"キャリブレーションを保存しました: {path}（誤差 {calibration.rms:.3f}）")
+        win.destroy()
+
+    def poll():
+        if not win.winfo_exists():
+            return
+        target = session.target     # 推論スレッドが進めるので1回だけ読む
+        if target is None:
+            finish(True)
+            return
+        w, h = canvas.winfo_width(), canvas.winfo_height()
+        x, y = target
+        canvas.delete("target")
+        canvas.create_oval(x * w - 12, y * h - 12, x * w + 12, y * h + 12,
+                           fill="red", outline="white", width=2, tags=("target",))
+        canvas.create_text(w // 2, h - 40, fill="white", tags=("target",),
+                           text=f"赤い点を見てください（{session.index + 1} / {len(session.targets)}）Esc で中止")
+        win.after(50, poll)
+
+    win.bind("<Escape>", lambda e: finish(False))
+    poll()
+
+
 # ----------------------------
 # メイン
 # ----------------------------
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="視線でカーソルを操作する")
+    parser.add_argument("--cursor-rate", type=float, default=60.0,
+                        help="カーソルを動かす頻度（Hz、カメラのフレームレートとは別）")
+    parser.add_argument("--lead", type=float, default=0.0,
+                        help="キャプチャからの遅れに加えて先読みする秒数")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="カーソルを動かさずに移動を記録するだけ")
+    parser.add_argument("--camera", type=int, default=0, help="カメラ番号")
+    parser.add_argument("--user", default=None,
+                        help="キャリブレーションを保存するユーザー名（省略時はログインユーザー）")
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    profiler = profiler_from_args(args)
+    # モデルの準備はウィンドウの作成・カメラのオープンと並行して進める
+    loader = FaceMeshLoader().start()
+
     root = tk.Tk()
     root.title("Gaze Control GUI")
     root.geometry("300x200")
@@ -199,18 +209,38 @@ def main():
     settings = Settings()
     center_window(root, 300, 200)
 
+    backend = RecordingBackend() if args.dry_run else None
+    cursor = CursorController(backend, settings.channel.current,
+                              rate=args.cursor_rate, lead=args.lead).start()
+
+    # 保存済みのキャリブレーションがあれば起動時に読み込む
+    calib_path = calibration_path(args.camera, args.user)
+    calibration = load_calibration(calib_path)
+    if calibration is not None:
+        cursor.set_calibration(calibration)
+        print(f"キャリブレーションを読み込みました: {calib_path}")
+
     ttk.Button(
         root,
         text="Open Settings",
-        command=lambda: open_settings_window(settings, root)
-    ).pack(pady=40)
+        command=lambda: open_settings_window(settings, root, cursor)
+    ).pack(pady=(40, 10))
+
+    ttk.Button(
+        root,
+        text="Calibrate",
+        command=lambda: open_calibration_window(root, cursor, calib_path)
+    ).pack()
 
     # OpenCV カメラループを別スレッドで実行
     stop_event = threading.Event()
-    threading.Thread(target=gaze_loop, args=(settings, stop_event), daemon=True).start()
+    threading.Thread(target=gaze_loop, args=(settings.channel, stop_event, cursor, profiler, args.camera, loader), daemon=True).start()
 
     root.mainloop()
     stop_event.set()  # Tkinter終了時にカメラ停止
+    cursor.stop()
+    print(f"カーソル移動: {cursor.moves} 回")
+    finish_profiler(profiler, args)
 
 if __name__ == "__main__":
     main()
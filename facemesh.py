@@ -0,0 +1,56 @@
+import threading, time
+
+
+def create_face_mesh(max_num_faces=1, refine_landmarks=True):
+    """虹彩検出用の FaceMesh を作成（mediapipe はここで初めて読み込む）"""
+    import mediapipe as mp
+    return mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=max_num_faces,
+        refine_landmarks=refine_landmarks,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+
+class FaceMeshLoader:
+    """mediapipe の読み込みと FaceMesh の作成を別スレッドで行う
+
+    起動直後に start() しておけば、カメラを開いたりウィンドウを作ったりしている間に
+    モデルの準備が進む。get() で準備ができるまで待って FaceMesh を受け取る
+    （作成に失敗していればその例外を投げ直す）。
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.face_mesh = None
+        self.error = None
+        self.elapsed = None     # 読み込みと作成にかかった秒数
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self.load, name="facemesh-loader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def load(self):
+        """同じスレッドで読み込む（比較・デバッグ用）"""
+        t0 = time.perf_counter()
+        try:
+            self.face_mesh = create_face_mesh(**self.kwargs)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.elapsed = time.perf_counter() - t0
+            self._done.set()
+        return self
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def get(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("FaceMesh の準備が間に合いませんでした")
+        if self.error is not None:
+            raise self.error
+        return self.face_mesh
@@ -0,0 +1,256 @@
+import itertools
+import numpy as np
+
+from landmarks import NUM_LANDMARKS, IRIS_INDEX
+from roi import FACE_BOUND_ROWS
+
+# 視線方向のコード（配列では int8 で持つ）
+DIRECTIONS = ("CENTER", "LEFT", "RIGHT", "UP", "DOWN")
+CENTER, LEFT, RIGHT, UP, DOWN = range(len(DIRECTIONS))
+
+# CENTER とみなす範囲（GazeMonitorWithNotification._classify_direction と同じ）
+DIRECTION_THRESHOLD = 0.35
+
+
+# ----------------------------
+# ランドマーク（全員分をまとめて計算）
+# ----------------------------
+class MultiLandmarkArray:
+    """複数の顔のランドマークを (max_faces, 478, 3) の float32 配列に変換する
+
+    LandmarkArray の複数人版。配列は最初に1回だけ確保し、全員分の必要な行を
+    1回の np.fromiter で埋める。以降の計算は顔の数によらず1回の配列演算で済む。
+    """
+
+    def __init__(self, max_faces, num_landmarks=NUM_LANDMARKS):
+        self.points = np.zeros((max_faces, num_landmarks, 3), np.float32)
+        self.count = 0
+        self._scale = np.ones(3, np.float32)
+        self._offset = np.zeros(3, np.float32)
+
+    def fill(self, faces, w, h, rows, offset=(0, 0)):
+        """faces（各顔の .landmark のリスト）の rows の行を書き込み、顔の数を返す"""
+        n = min(len(faces), len(self.points))
+        self.count = n
+        if n == 0:
+            return 0
+        self._scale[0] = w
+        self._scale[1] = h
+        self._scale[2] = w
+        self._offset[0] = offset[0]
+        self._offset[1] = offset[1]
+        values = np.fromiter(
+            itertools.chain.from_iterable(
+                (landmarks[i].x, landmarks[i].y, landmarks[i].z)
+                for landmarks in faces[:n] for i in rows
+            ),
+            np.float32, n * len(rows) * 3,
+        ).reshape(n, len(rows), 3)
+        values *= self._scale
+        values += self._offset
+        self.points[:n, rows] = values
+        return n
+
+    def iris_centers(self):
+        """各顔の左右の虹彩中心 (n, 2, 2)：顔 × [左, 右] × [x, y]"""
+        iris = self.points[:self.count][:, IRIS_INDEX, :2]
+        return np.add.reduce(iris, axis=2) * (1.0 / IRIS_INDEX.shape[1])
+
+    def bounds(self):
+        """各顔の外接矩形 (n, 4)：[x0, y0, x1, y1]"""
+        xy = self.points[:self.count][:, FACE_BOUND_ROWS, :2]
+        return np.concatenate([xy.min(axis=1), xy.max(axis=1)], axis=1)
+
+
+def screen_gazes(iris_centers, w, h):
+    """screen_gaze の複数人版
+
+    戻り値: (虹彩 (n, 2, 2), 両目の中点 (n, 2), 視線のずれ (n, 2))。座標は int。
+    """
+    iris = iris_centers.astype(int)
+    eyes_center = (iris.sum(axis=1) / 2).astype(int)
+    half = np.array([w // 2, h // 2])
+    return iris, eyes_center, (eyes_center - half) / half
+
+
+def classify_directions(gaze, threshold=DIRECTION_THRESHOLD):
+    """(n, 2) の視線のずれ → 方向コード (n,)"""
+    x, y = gaze[:, 0], gaze[:, 1]
+    ax, ay = np.abs(x), np.abs(y)
+    codes = np.where(ax > ay,
+                     np.where(x < 0, LEFT, RIGHT),
+                     np.where(y < 0, UP, DOWN)).astype(np.int8)
+    codes[(ax < threshold) & (ay < threshold)] = CENTER
+    return codes
+
+
+# ----------------------------
+# 追跡（フレームをまたいで同じ ID を振る）
+# ----------------------------
+def box_iou(a, b):
+    """(n, 4) と (m, 4) の矩形の IoU (n, m)"""
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class FaceTracker:
+    """検出した顔を前フレームまでの顔と対応づけ、安定した ID を振る
+
+    顔は max_faces 個の枠（スロット）で管理し、ID・矩形・見失ったフレーム数を
+    枠ごとの配列で持つ。対応づけは IoU が min_iou 以上の組を優先し、
+    重なりが足りなければ中心間の距離（追跡中の顔の大きさで割ったもの）が
+    max_distance 未満の組を使う（どちらも大きい順の貪欲法。人数が少ないので十分）。
+    max_missing フレーム続けて見つからない顔は枠を空ける。
+    """
+
+    def __init__(self, max_faces, min_iou=0.3, max_distance=0.5, max_missing=15):
+        self.min_iou = min_iou
+        self.max_distance = max_distance
+        self.max_missing = max_missing
+        self.ids = np.full(max_faces, -1, np.int64)      # -1: 空き
+        self.boxes = np.zeros((max_faces, 4), np.float32)
+        self.missing = np.zeros(max_faces, np.int32)
+        self.next_id = 0
+
+    @property
+    def active(self):
+        return self.ids >= 0
+
+    def reset(self):
+        self.ids[:] = -1
+        self.missing[:] = 0
+
+    def _scores(self, boxes):
+        """(検出, 枠) ごとの対応づけの優先度。0 以下は対応づけない"""
+        iou = box_iou(boxes, self.boxes)
+        centers = (boxes[:, None, :2] + boxes[:, None, 2:]) / 2
+        tracked = (self.boxes[None, :, :2] + self.boxes[None, :, 2:]) / 2
+        size = np.maximum(self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1])
+        distance = np.hypot(*(centers - tracked).transpose(2, 0, 1)) / np.maximum(size, 1.0)
+        # IoU で対応する組（1 より大きい）> 距離で対応する組（0〜1）
+        scores = np.where(iou >= self.min_iou, 1.0 + iou,
+                          np.where(distance < self.max_distance,
+                                   1.0 - distance / self.max_distance, 0.0))
+        scores[:, ~self.active] = 0.0
+        return scores
+
+    def associate(self, boxes):
+        """(n, 4) の検出矩形 → 各検出の枠番号 (n,)。ID は self.ids[枠番号]
+
+        n は枠の数以下（MultiLandmarkArray.fill が max_faces 人で切り詰める）。
+        """
+        n = len(boxes)
+        slots = np.full(n, -1, np.int64)
+        matched = np.zeros(len(self.ids), bool)
+        if n and self.active.any():
+            scores = self._scores(boxes)
+            # 優先度の高い組から順に、検出・枠のどちらもまだ使っていなければ採用
+            width = scores.shape[1]
+            flat = scores.ravel()
+            for k in np.argsort(-flat).tolist():
+                if flat[k] <= 0.0:
+                    break
+                det, slot = divmod(k, width)
+                if slots[det] < 0 and not matched[slot]:
+                    slots[det] = slot
+                    matched[slot] = True
+
+        # 見つからなかった顔
+        lost = self.active & ~matched
+        self.missing[lost] += 1
+        self.ids[lost & (self.missing > self.max_missing)] = -1
+
+        # 対応のない検出には新しい ID（空きがなければ最も長く見失っている顔の枠を使う）
+        for det in np.flatnonzero(slots < 0):
+            free = np.flatnonzero(~self.active)
+            if len(free):
+                slot = free[0]
+            else:
+                candidates = np.flatnonzero(~matched)
+                slot = candidates[np.argmax(self.missing[candidates])]
+            self.ids[slot] = self.next_id
+            self.next_id += 1
+            slots[det] = slot
+            matched[slot] = True
+
+        self.boxes[slots] = boxes
+        self.missing[slots] = 0
+        return slots
+
+
+# ----------------------------
+# 顔ごとの状態
+# ----------------------------
+class FaceStates:
+    """顔ごとの監視状態（方向・継続時間・統計・最後の通知時刻）
+
+    FaceTracker と同じ枠番号で、状態ごとに1本の配列で持つ。枠の ID が
+    変わっていたら（別の人が入ったら）その枠の状態を初期化する。
+    """
+
+    def __init__(self, max_faces):
+        self.ids = np.full(max_faces, -1, np.int64)
+        self.direction = np.full(max_faces, CENTER, np.int8)
+        self.since = np.zeros(max_faces)                 # 現在の方向になった時刻
+        self.same_frames = np.zeros(max_faces, np.int32)
+        self.total_frames = np.zeros(max_faces, np.int64)
+        self.focused_frames = np.zeros(max_faces, np.int64)
+        self.last_notification = np.full(max_faces, -np.inf)
+
+    def reset(self, slots, ids, now):
+        self.ids[slots] = ids
+        self.direction[slots] = CENTER
+        self.since[slots] = now
+        self.same_frames[slots] = 0
+        self.total_frames[slots] = 0
+        self.focused_frames[slots] = 0
+        self.last_notification[slots] = -np.inf
+
+    def update(self, slots, ids, directions, now, distraction_time, cooldown):
+        """1フレーム分をまとめて更新
+
+        戻り値: (直前の方向, 方向が変わった顔のマスク, 通知すべき顔のマスク)。
+        通知の条件は1人の場合と同じ（CENTER が distraction_time 秒以上続いたら、
+        cooldown 秒に1回まで）。
+        """
+        fresh = self.ids[slots] != ids
+        if fresh.any():
+            self.reset(slots[fresh], ids[fresh], now)
+
+        previous = self.direction[slots]
+        changed = previous != directions
+        self.direction[slots] = directions
+        self.since[slots] = np.where(changed, now, self.since[slots])
+        self.same_frames[slots] = np.where(changed, 0, self.same_frames[slots] + 1)
+
+        focused = directions == CENTER
+        self.count(slots, ids, directions)
+        due = (focused
+               & (now - self.since[slots] >= distraction_time)
+               & (now - self.last_notification[slots] > cooldown))
+        self.last_notification[slots[due]] = now
+        return previous, changed, due
+
+    def count(self, slots, ids, directions):
+        """統計に1フレーム分を数える（推論を間引いたフレームは直前の結果で呼ぶ）"""
+        same = self.ids[slots] == ids
+        slots = slots[same]
+        self.total_frames[slots] += 1
+        self.focused_frames[slots] += directions[same] == CENTER
+
+    def summary(self, active):
+        """追跡中の顔ごとの統計（定期サマリー用）"""
+        slots = np.flatnonzero(active & (self.ids >= 0) & (self.total_frames > 0))
+        return [{
+            'face': int(self.ids[s]),
+            'direction': DIRECTIONS[self.direction[s]],
+            'total_frames': int(self.total_frames[s]),
+            'focus_rate': round(float(self.focused_frames[s] / self.total_frames[s] * 100), 1),
+        } for s in slots]
@@ -0,0 +1,130 @@
+import os, shutil, subprocess, sys
+from collections import OrderedDict
+
+from PIL import ImageFont
+
+# 追加のフォント検索ディレクトリ（os.pathsep 区切り）
+FONT_PATH_ENV = "MKIMG_FONT_PATH"
+
+FONT_DIRS = {
+    'darwin': ["/System/Library/Fonts", "/Library/Fonts", "~/Library/Fonts"],
+    'win32': [os.path.join(os.environ.get("WINDIR", "C:/Windows"), "Fonts")],
+    'linux': ["/usr/share/fonts", "/usr/local/share/fonts", "~/.local/share/fonts", "~/.fonts"],
+}
+
+# 名前で見つからないときに使う日本語対応フォント（見つかった最初のもの）
+FALLBACKS = [
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+    "/System/Library/Fonts/Hiragino Sans GB.ttc",
+    "C:/Windows/Fonts/YuGothM.ttc",
+    "C:/Windows/Fonts/meiryo.ttc",
+    "C:/Windows/Fonts/msgothic.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf",
+    "/usr/share/fonts/truetype/takao-gothic/TakaoGothic.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+]
+
+FONT_EXTENSIONS = (".ttf", ".ttc", ".otf")
+
+
+def _normalize(name):
+    return name.casefold().replace(" ", "").replace("-", "").replace("_", "")
+
+
+class FontManager:
+    """フォント名 → ファイルの解決と、(フォント名, サイズ) ごとの ImageFont の LRU キャッシュ
+
+    解決の順番: ファイルパスならそのまま → fontconfig（fc-match、Linux など）→
+    検索ディレクトリ内のファイル名 → FALLBACKS。どれもなければ PIL 内蔵のフォント。
+    解決結果もキャッシュするので、サイズ変更はディスクを読まずに済む（初回を除く）。
+    """
+
+    def __init__(self, search_path=None, cache_size=32):
+        if search_path is None:
+            extra = os.environ.get(FONT_PATH_ENV, "")
+            search_path = [p for p in extra.split(os.pathsep) if p]
+            platform = "linux" if sys.platform.startswith("linux") else sys.platform
+            search_path += FONT_DIRS.get(platform, [])
+        self.search_path = [os.path.expanduser(p) for p in search_path]
+        self.cache_size = cache_size
+        self.fonts = OrderedDict()      # (family, size) -> ImageFont
+        self.paths = {}                 # family -> ファイルパス（None: 見つからない）
+        self._files = None              # 検索ディレクトリのフォントファイル一覧
+
+    def get(self, family=None, size=20):
+        key = (family, size)
+        font = self.fonts.get(key)
+        if font is not None:
+            self.fonts.move_to_end(key)
+            return font
+        path = self.resolve(family)
+        font = ImageFont.truetype(path, size) if path else ImageFont.load_default(size)
+        self.fonts[key] = font
+        if len(self.fonts) > self.cache_size:
+            self.fonts.popitem(last=False)
+        return font
+
+    def resolve(self, family):
+        """フォント名（またはファイルパス）→ フォントファイルのパス（なければ None）"""
+        if family not in self.paths:
+            self.paths[family] = self._resolve(family)
+        return self.paths[family]
+
+    def _resolve(self, family):
+        if family:
+            if os.path.isfile(family):
+                return family
+            path = self._fontconfig(family) or self._search(family)
+            if path:
+                return path
+        for path in FALLBACKS:
+            if os.path.isfile(path):
+                return path
+        return self._fontconfig(":lang=ja")
+
+    def _fontconfig(self, pattern):
+        if shutil.which("fc-match") is None:
+            return None
+        try:
+            out = subprocess.run(["fc-match", "-f", "%{family}\n%{file}", pattern],
+                                 capture_output=True, text=True, timeout=5).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        family, _, path = out.partition("\n")
+        # 一致しなくても代わりのフォントを返すので、ファミリー名が合っているときだけ使う
+        if path and os.path.isfile(path) and (pattern.startswith(":") or
+                                              _normalize(pattern) in _normalize(family)):
+            return path
+        return None
+
+    def _search(self, family):
+        # 名前を含むファイルのうち、いちばん名前の短いもの（Bold などの派生より標準を優先）
+        want = _normalize(family)
+        best = None
+        for path in self._font_files():
+            name = _normalize(os.path.splitext(os.path.basename(path))[0])
+            if want in name and (best is None or len(name) < best[0]):
+                best = (len(name), path)
+        return best[1] if best else None
+
+    def _font_files(self):
+        if self._files is None:
+            self._files = []
+            for root in self.search_path:
+                for dirpath, _, names in os.walk(root):
+                    self._files += sorted(os.path.join(dirpath, n) for n in names
+                                          if n.lower().endswith(FONT_EXTENSIONS))
+        return self._files
+
+
+_default = None
+
+
+def get_font(family=None, size=20):
+    """共有の FontManager からフォントを取得"""
+    global _default
+    if _default is None:
+        _default = FontManager()
+    return _default.get(family, size)
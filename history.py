@@ -0,0 +1,153 @@
+import zlib
+
+from PIL import Image
+
+from rects import clip, union, tiles_in
+
+
+def _pack(image, compress):
+    data = image.tobytes()
+    return zlib.compress(data, 1) if compress else data
+
+
+def _unpack(data, size, compress):
+    if compress:
+        data = zlib.decompress(data)
+    return Image.frombytes("RGBA", size, data)
+
+
+class PatchEdit:
+    """1回の操作で変わったタイルの変更前・変更後（レイヤーごと）"""
+
+    def __init__(self, tile_size, compress):
+        self.tile_size = tile_size
+        self.compress = compress
+        self.patches = []       # [(layer, box, before, after), ...]
+        self.nbytes = 0
+
+    def add(self, layer, box, before, after):
+        self.patches.append((layer, box, before, after))
+        self.nbytes += len(before) + len(after)
+
+    def _apply(self, which):
+        rect = None
+        for patch in self.patches:
+            layer, box = patch[0], patch[1]
+            size = (box[2] - box[0], box[3] - box[1])
+            layer.image.paste(_unpack(patch[which], size, self.compress), box[:2])
+            layer.generation += 1
+            rect = union(rect, box)
+        return rect
+
+    def undo(self, layers):
+        return self._apply(2)
+
+    def redo(self, layers):
+        return self._apply(3)
+
+
+class LayerAdded:
+    """レイヤーの追加（取り消すとレイヤーごと外す）"""
+
+    def __init__(self, layer, index):
+        self.layer = layer
+        self.index = index
+        self.nbytes = layer.image.width * layer.image.height * 4
+
+    def undo(self, layers):
+        layers.remove(self.layer)
+        return None
+
+    def redo(self, layers):
+        layers.insert(self.index, self.layer)
+        return None
+
+
+class History:
+    """レイヤーの差分（変わったタイルだけ）で Undo / Redo を記録する
+
+    操作の開始で begin()、描画の直前に touch() で描く範囲を知らせ、操作の終わりに
+    commit() する。touch() された範囲のタイルだけ変更前を保存し、commit() で
+    変更後を保存するので、履歴のメモリは描いた範囲の大きさに比例する。
+    記録の合計が budget バイトを超えたら古い Undo から捨てる。
+    """
+
+    def __init__(self, budget=64 * 1024 * 1024, tile_size=64, compress=True):
+        self.budget = budget
+        self.tile_size = tile_size
+        self.compress = compress
+        self.undo_stack = []
+        self.redo_stack = []
+        self.nbytes = 0
+        self._open = None       # 記録中の操作: {layer: {(tx, ty): (box, before)}}
+
+    # ---- 記録 ----
+    def begin(self):
+        self._open = {}
+
+    def touch(self, layer, rect):
+        """これから layer の rect（画像座標）に描く。初めて触るタイルの変更前を保存"""
+        if self._open is None:
+            return
+        w, h = layer.image.size
+        rect = clip(rect, w, h)
+        tiles = self._open.setdefault(layer, {})
+        t = self.tile_size
+        for tx, ty in tiles_in(rect, t):
+            if (tx, ty) in tiles:
+                continue
+            box = (tx * t, ty * t, min(w, (tx + 1) * t), min(h, (ty + 1) * t))
+            tiles[(tx, ty)] = (box, _pack(layer.image.crop(box), self.compress))
+
+    def commit(self):
+        """操作を確定して履歴に積む。何も変わっていなければ積まない"""
+        if self._open is None:
+            return
+        edit = PatchEdit(self.tile_size, self.compress)
+        for layer, tiles in self._open.items():
+            for box, before in tiles.values():
+                after = _pack(layer.image.crop(box), self.compress)
+                if after != before:
+                    edit.add(layer, box, before, after)
+        self._open = None
+        if edit.patches:
+            self._push(edit)
+
+    def layer_added(self, layer, index):
+        self._push(LayerAdded(layer, index))
+
+    def _push(self, entry):
+        self.undo_stack.append(entry)
+        self.nbytes += entry.nbytes
+        for dropped in self.redo_stack:
+            self.nbytes -= dropped.nbytes
+        self.redo_stack = []
+        self._evict()
+
+    def _evict(self):
+        # 直前の1件は残す（それ1件で予算を超えても Undo できるように）
+        while self.nbytes > self.budget and len(self.undo_stack) > 1:
+            self.nbytes -= self.undo_stack.pop(0).nbytes
+
+    # ---- 取り消し・やり直し ----
+    def undo(self, layers):
+        """1件取り消す。戻り値は再描画する矩形（レイヤー構成が変わったら None）
+        取り消すものがなければ False"""
+        if not self.undo_stack:
+            return False
+        entry = self.undo_stack.pop()
+        self.redo_stack.append(entry)
+        return entry.undo(layers)
+
+    def redo(self, layers):
+        if not self.redo_stack:
+            return False
+        entry = self.redo_stack.pop()
+        self.undo_stack.append(entry)
+        return entry.redo(layers)
+
+    def clear(self):
+        self.undo_stack = []
+        self.redo_stack = []
+        self.nbytes = 0
+        self._open = None
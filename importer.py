@@ -0,0 +1,75 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# 仮表示はキャンバスの 1/PREVIEW_SCALE の解像度でデコードする
+PREVIEW_SCALE = 8
+
+
+def decode_for_canvas(path, size):
+    """画像を読み込み、RGBA で size に合わせる
+
+    JPEG は draft() でデコード時に縮小する（size 以上の範囲で 1/2〜1/8）。
+    それ以外でも十分大きければ reduce() で整数倍に縮めてからリサイズする。
+    """
+    img = Image.open(path)
+    img.draft("RGB", size)
+    img = img.convert("RGBA")
+    factor = min(img.width // size[0], img.height // size[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img.resize(size)
+
+
+def decode_preview(path, size):
+    """仮表示用の低解像度画像（JPEG のように縮小デコードできる形式だけ、それ以外は None）"""
+    img = Image.open(path)
+    if img.format != "JPEG":
+        return None
+    small = (max(1, size[0] // PREVIEW_SCALE), max(1, size[1] // PREVIEW_SCALE))
+    img.draft("RGB", small)
+    return img.convert("RGBA").resize(small).resize(size, Image.NEAREST)
+
+
+class ImageImporter:
+    """画像のデコードと縮小をワーカースレッドで行う
+
+    submit() した画像ごとに、結果が (key, 種類, 画像 or 例外) で poll() に届く。
+    種類は "preview"（仮表示、JPEG のみ）/ "done" / "error"。
+    poll() は待たないので Tk の after() から定期的に呼ぶ。
+    """
+
+    def __init__(self, size, workers=2):
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import")
+        self.results = queue.SimpleQueue()
+        self.pending = 0
+
+    def submit(self, path, key):
+        self.pending += 1
+        self.executor.submit(self._run, path, key)
+
+    def _run(self, path, key):
+        try:
+            preview = decode_preview(path, self.size)
+            if preview is not None:
+                self.results.put((key, "preview", preview))
+            self.results.put((key, "done", decode_for_canvas(path, self.size)))
+        except Exception as e:
+            self.results.put((key, "error", e))
+
+    def poll(self):
+        """届いている結果をすべて返す（なければ空リスト）"""
+        out = []
+        while True:
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                return out
+            if item[1] != "preview":
+                self.pending -= 1
+            out.append(item)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,105 @@
+import itertools
+import numpy as np
+
+# FaceMesh（refine_landmarks=True）のランドマーク数
+NUM_LANDMARKS = 478
+
+# 虹彩のランドマークインデックス
+LEFT_IRIS = [474, 475, 476, 477]
+RIGHT_IRIS = [469, 470, 471, 472]
+
+# 目の周囲のランドマーク
+LEFT_EYE = [33, 133, 160, 159, 158, 144, 145, 153]
+RIGHT_EYE = [362, 263, 387, 386, 385, 380, 374, 373]
+
+# 左右をまとめたインデックス配列（ファンシーインデックス用）
+IRIS_INDEX = np.array([LEFT_IRIS, RIGHT_IRIS])   # (2, 4)
+EYE_INDEX = np.array([LEFT_EYE, RIGHT_EYE])      # (2, 8)
+
+# 虹彩だけ使う場合に変換する行（Python のループで回すので list のまま持つ）
+IRIS_ROWS = LEFT_IRIS + RIGHT_IRIS
+# 虹彩と目の周囲を使う場合に変換する行
+EYE_ROWS = IRIS_ROWS + LEFT_EYE + RIGHT_EYE
+
+# 視線比率の正規化幅（ピクセル）
+GAZE_RATIO_SCALE = np.array([30.0, 20.0], np.float32)
+
+
+class LandmarkArray:
+    """FaceMesh のランドマークをピクセル座標の (478, 3) float32 配列に変換する
+
+    配列は最初に1回だけ確保して使い回す。z は x と同じ（幅）スケール。
+    rows を指定すると必要な行だけ変換する（他の行は前フレームの値のまま）。
+    毎フレームの処理では必ず rows を指定すること。478 点すべての変換は
+    旧実装（虹彩 8 点のリスト + np.mean）の数倍遅く、解析・デバッグ用。
+    """
+
+    def __init__(self, num_landmarks=NUM_LANDMARKS):
+        self.points = np.zeros((num_landmarks, 3), np.float32)
+        self._scale = np.ones(3, np.float32)
+        self._offset = np.zeros(3, np.float32)
+        self._row_index = {}    # rows（tuple）→ インデックス配列（リストのままだと代入が遅い）
+
+    def fill(self, landmarks, w, h, rows=None, offset=(0, 0)):
+        """results.multi_face_landmarks[i].landmark を配列に書き込む
+
+        w, h は FaceMesh に渡した画像のサイズ。切り出した画像で推論した場合は
+        offset に切り出し位置 (x0, y0) を渡すと元フレームの座標になる。
+        rows=None（478 点すべて）は遅いので、毎フレームの処理では使わない。
+        """
+        self._scale[0] = w
+        self._scale[1] = h
+        self._scale[2] = w
+        self._offset[0] = offset[0]
+        self._offset[1] = offset[1]
+
+        if rows is None:
+            n = min(len(landmarks), len(self.points))
+            values = np.fromiter(
+                itertools.chain.from_iterable((p.x, p.y, p.z) for p in itertools.islice(landmarks, n)),
+                np.float32, n * 3,
+            ).reshape(n, 3)
+            np.multiply(values, self._scale, out=self.points[:n])
+            self.points[:n] += self._offset
+        else:
+            values = np.fromiter(
+                itertools.chain.from_iterable(
+                    (landmarks[i].x, landmarks[i].y, landmarks[i].z) for i in rows
+                ),
+                np.float32, len(rows) * 3,
+            ).reshape(-1, 3)
+            values *= self._scale
+            values += self._offset
+            key = tuple(rows)
+            index = self._row_index.get(key)
+            if index is None:
+                index = self._row_index[key] = np.array(rows, np.intp)
+            self.points[index] = values
+        return self.points
+
+    def iris_centers(self):
+        """左右の虹彩中心 (2, 2)：[左, 右] × [x, y]"""
+        # np.mean はラッパーのオーバーヘッドが大きいので add.reduce で平均する
+        return np.add.reduce(self.points[IRIS_INDEX, :2], axis=1) * (1.0 / IRIS_INDEX.shape[1])
+
+    def eye_centers(self):
+        """左右の目（眼窩）の中心 (2, 2)"""
+        return np.add.reduce(self.points[EYE_INDEX, :2], axis=1) * (1.0 / EYE_INDEX.shape[1])
+
+    def gaze_ratios(self):
+        """虹彩の目の中心からの相対位置 (2, 2)（-1.0 ~ 1.0）"""
+        ratios = (self.iris_centers() - self.eye_centers()) / GAZE_RATIO_SCALE
+        return np.clip(ratios, -1.0, 1.0, out=ratios)
+
+
+def screen_gaze(iris_centers, w, h):
+    """両目の虹彩中心から画面中心に対するずれを計算
+
+    戻り値: (左虹彩, 右虹彩, 両目の中点, gaze_x, gaze_y)。座標は int。
+    """
+    iris = iris_centers.astype(int)
+    eyes_center = (iris.sum(axis=0) / 2).astype(int)
+    half_w, half_h = w // 2, h // 2
+    gaze_x = (eyes_center[0] - half_w) / half_w
+    gaze_y = (eyes_center[1] - half_h) / half_h
+    return iris[0], iris[1], eyes_center, gaze_x, gaze_y
@@ -1,14 +1,13 @@
 import tkinter as tk
-import tkinter.font as tkFont
 from tkinter import colorchooser, filedialog, simpledialog
-from PIL import Image, ImageDraw, ImageTk, ImageFont
-import copy
 
-class Layer:
-    def __init__(self, w, h):
-        # RGBA レイヤー（透明背景）
-        self.image = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-        self.draw = ImageDraw.Draw(self.image)
+from document import Document, Layer
+from fonts import FontManager
+from importer import ImageImporter
+from project import Project, EXTENSION
+from tileview import TileView, GridOverlay
+from rects import union
+from stroke import Stroke
 
 class Editor:
     def __init__(self, root):
@@ -21,13 +20,8 @@ class Editor:
         self.grid_size = 20
         self.use_grid = True
 
-        # ---- レイヤー管理 ----
-        self.layers = [Layer(self.w, self.h)]
-        self.active_layer = 0
-
-        # ---- Undo / Redo ----
-        self.undo_stack = []
-        self.redo_stack = []
+        # ---- 文書（レイヤー・合成・Undo / Redo。描画は Tk に依存しない document.py）----
+        self.doc = Document(self.w, self.h)
 
         # ---- モード管理 ----
         self.mode = "draw"      # draw / erase / rect / oval / text / select
@@ -44,6 +38,10 @@ class Editor:
         self.canvas = tk.Canvas(root, bg="gray", width=self.w, height=self.h)
         self.canvas.pack(fill="both", expand=True)
 
+        # ---- 表示（変更のあったタイルだけ更新する）----
+        self.view = TileView(self.canvas)
+        self.grid = GridOverlay(self.canvas)
+
         # Bind events
         self.canvas.bind("<ButtonPress-1>", self.on_press)
         self.canvas.bind("<B1-Motion>", self.on_drag)
@@ -54,6 +52,19 @@ class Editor:
         self.canvas.bind("<ButtonPress-2>", self.pan_start)    # middle button
         self.canvas.bind("<B2-Motion>", self.pan_move)
 
+        # ---- 再描画の間引き（最短 frame_ms ごとにまとめて表示更新）----
+        self.frame_ms = 16
+        self.frame_job = None
+        self.pending_dirty = None
+        self.stroke = None
+        self.stroke_smoothing = 0.0  # 0〜1（大きいほど手ぶれ補正が強い）
+
+        # ---- プロジェクトファイル（レイヤーごとに保存、上書きは変わったレイヤーだけ）----
+        self.project = None
+
+        # ---- 画像の読み込み（デコードはワーカースレッド）----
+        self.importer = ImageImporter((self.w, self.h))
+
         # ---- 一時変数 ----
         self.start_x = None
         self.start_y = None
@@ -66,16 +77,43 @@ class Editor:
         self.font_size = 20
         self.font_family = "Yu Gothic"  # 日本語対応の代表的フォント
 
-        self.text_font = ImageFont.truetype(
-            "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
-            self.font_size
-        )
+        # フォントファイルは OS ごとに探し、サイズごとの ImageFont をキャッシュする
+        self.fonts = FontManager()
+        self.text_font = self.fonts.get(self.font_family, self.font_size)
         # UI
         self.create_ui()
 
         # 最初の表示
         self.update_canvas()
 
+        # 終了時に読み込みのワーカーとプロジェクトファイルを閉じる
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
+    def close(self):
+        # 待ち行列に残っている読み込みは取り消す（実行中の分が終わればスレッドも終わる）
+        self.importer.close()
+        if self.project is not None:
+            self.project.close()
+            self.project = None
+        self.root.destroy()
+
+    # ---------------- 文書 ----------------
+    @property
+    def layers(self):
+        return self.doc.layers
+
+    @property
+    def active_layer(self):
+        return self.doc.active_layer
+
+    @active_layer.setter
+    def active_layer(self, index):
+        self.doc.active_layer = index
+
+    @property
+    def history(self):
+        return self.doc.history
+
     # ---------------- ユーティリティ ----------------
     def snap(self, v):
         if not self.use_grid or self.grid_size <= 0:
@@ -119,6 +157,7 @@ class Editor:
         tk.Button(frame, text="⤻ Redo", command=self.redo).pack(side="left")
         tk.Button(frame, text="グリッド ON/OFF", command=self.toggle_grid).pack(side="left")
         tk.Button(frame, text="💾 保存", command=self.save).pack(side="left")
+        tk.Button(frame, text="📂 開く", command=self.open_project).pack(side="left")
 
     def set_mode(self, m):
         self.mode = m
@@ -138,65 +177,72 @@ class Editor:
 
     def toggle_grid(self):
         self.use_grid = not self.use_grid
-        self.update_canvas()
+        self.draw_grid()
 
     def change_font_size(self):
         self.font_size = self.font_var.get()
-        self.text_font = tkFont.Font(family=self.font_family, size=self.font_size)
+        self.text_font = self.fonts.get(self.font_family, self.font_size)
 
     # ---------------- Undo / Redo ----------------
-    def push_undo(self):
-        merged = self.merge_layers()
-        # store a copy of merged image
-        self.undo_stack.append(copy.deepcopy(merged))
-        # clear redo stack per common behavior
-        self.redo_stack = []
-
     def undo(self):
-        if not self.undo_stack:
-            return
-        prev = self.undo_stack.pop()
-        self.redo_stack.append(self.merge_layers())
-        # replace current single merged layer approach:
-        layer = Layer(self.w, self.h)
-        layer.image = prev
-        layer.draw = ImageDraw.Draw(layer.image)
-        self.layers = [layer]
-        self.active_layer = 0
-        self.update_canvas()
+        self.after_history(self.doc.undo())
 
     def redo(self):
-        if not self.redo_stack:
+        self.after_history(self.doc.redo())
+
+    def after_history(self, rect):
+        """Undo / Redo の結果を表示に反映（False: 何もしていない、None: レイヤー構成の変更）"""
+        if rect is False:
             return
-        nxt = self.redo_stack.pop()
-        self.undo_stack.append(self.merge_layers())
-        layer = Layer(self.w, self.h)
-        layer.image = nxt
-        layer.draw = ImageDraw.Draw(layer.image)
-        self.layers = [layer]
-        self.active_layer = 0
-        self.update_canvas()
+        if rect is None:
+            self.update_canvas()
+        else:
+            self.refresh(rect)
 
     # ---------------- 画像読み込み（レイヤーへ） ----------------
     def load_image_to_layer(self):
-        path = filedialog.askopenfilename()
-        if not path:
+        paths = filedialog.askopenfilenames()
+        if not paths:
             return
-        img = Image.open(path).convert("RGBA")
-        # リサイズは任意（ここではキャンバス全体に合わせる）
-        img = img.resize((self.w, self.h))
-        self.push_undo()
-        layer = Layer(self.w, self.h)
-        layer.image = img
-        layer.draw = ImageDraw.Draw(layer.image)
-        self.layers.append(layer)
-        self.active_layer = len(self.layers) - 1
+        # 空のレイヤーを先に追加し、デコードが終わったら中身を差し替える
+        # （大きな画像でも UI を止めない。JPEG は途中で低解像度の仮表示を出す）。
+        # 差し替えるまでレイヤーは描画・保存できない
+        for path in paths:
+            layer = Layer(self.w, self.h)
+            layer.loading = True
+            self.doc.add_layer(layer)
+            self.importer.submit(path, layer)
         self.update_canvas()
+        self.root.after(50, self.poll_imports)
+
+    def poll_imports(self):
+        for layer, kind, result in self.importer.poll():
+            if kind == "preview":
+                # 仮表示は合成にだけ使う（レイヤーの画像・履歴・保存には入らない）
+                layer.preview = result
+            else:
+                if kind == "error":
+                    print("読み込みに失敗しました:", result)
+                else:
+                    # リサイズは任意（ここではキャンバス全体に合わせる）
+                    layer.image.paste(result)
+                    layer.generation += 1
+                layer.preview = None
+                layer.loading = False
+            if layer in self.layers:
+                self.doc.compositor.invalidate((0, 0, self.w, self.h))
+                self.refresh((0, 0, self.w, self.h))
+        if self.importer.pending:
+            self.root.after(50, self.poll_imports)
 
     # ---------------- マウス操作 ----------------
     def on_press(self, event):
-        # 保存用に undo push（ドラッグ操作の最初）
-        self.push_undo()
+        if self.doc.locked:
+            # 読み込み中のレイヤーには描かない（読み込みが終わると中身が差し替わる）
+            self.start_x = self.start_y = None
+            return
+        # 操作の記録開始（ドラッグ操作の最初）。確定は on_release
+        self.history.begin()
 
         # クリック座標を画像座標に変換
         cx, cy = self.screen_to_canvas(event.x, event.y)
@@ -205,6 +251,11 @@ class Editor:
         cy = self.snap(cy)
         self.start_x, self.start_y = cx, cy
 
+        if self.mode == "draw":
+            self.stroke = Stroke(cx, cy, self.brush_size, self.stroke_smoothing)
+            self.request_refresh()
+            return
+
         # テキストモード：PIL に直接描画する（方式A）
         if self.mode == "text":
             txt = simpledialog.askstring("テキスト", "文字を入力:")
@@ -213,14 +264,10 @@ class Editor:
                 cy = self.snap(self.start_y)
 
                 # --- PIL に直接描画 ---
-                draw = self.layers[self.active_layer].draw
-                draw.text(
-                    (cx, cy),
-                    txt,
-                    fill=self.color,
-                    font=self.text_font  # ← 日本語＆サイズ対応フォント
-                )
-            self.update_canvas()
+                dirty = self.doc.text(cx, cy, txt, self.color,
+                                      self.text_font)  # ← 日本語＆サイズ対応フォント
+                self.refresh(dirty)
+            self.history.commit()
             return
 
         # 選択（方式A では編集不可だが placeholder）
@@ -233,28 +280,24 @@ class Editor:
         # そしてドラッグイベントで一時表示（canvas上）を行います。
 
     def on_drag(self, event):
+        if self.start_x is None:
+            return
         # 画面（イベント）座標 -> 画像座標
         x_raw, y_raw = self.screen_to_canvas(event.x, event.y)
         x = self.snap(x_raw)
         y = self.snap(y_raw)
 
-        # フリーハンド描画（PIL レイヤーに直接描画）
-        if self.mode == "draw":
-            draw = self.layers[self.active_layer].draw
-            draw.line([self.start_x, self.start_y, x, y],
-                      fill=self.color, width=self.brush_size)
-            self.start_x, self.start_y = x, y
-            # すぐに表示更新
-            self.update_canvas(show_temp=False)
+        # フリーハンド描画（点をためておき、次の表示フレームでまとめて描く）
+        if self.mode == "draw" and self.stroke:
+            self.stroke.add(x, y)
+            self.request_refresh()
             return
 
         # 消しゴム（PIL上で透明にする）
         if self.mode == "erase":
-            draw = self.layers[self.active_layer].draw
-            r = int(self.brush_size)
-            draw.ellipse([x - r, y - r, x + r, y + r], fill=(0, 0, 0, 0))
+            dirty = self.doc.erase(x, y, int(self.brush_size))
             self.start_x, self.start_y = x, y
-            self.update_canvas(show_temp=False)
+            self.request_refresh(dirty)
             return
 
         # 矩形 / 楕円 の一時プレビュー（Canvas に一時表示）
@@ -279,28 +322,23 @@ class Editor:
             return
 
     def on_release(self, event):
+        if self.start_x is None:
+            return
         # リリース時の座標を取得してスナップ
         cx_raw, cy_raw = self.screen_to_canvas(event.x, event.y)
         cx = self.snap(cx_raw)
         cy = self.snap(cy_raw)
 
+        # ストロークの残りを描いて、たまっている表示更新を済ませる
+        if self.mode == "draw" and self.stroke:
+            self.stroke.finish(cx, cy)
+        self.flush_frame()
+        self.stroke = None
+
         # 矩形/楕円を確定して PIL に描く
         if self.mode in ("rect", "oval") and self.temp_shape:
-            draw = self.layers[self.active_layer].draw
-            shape = [self.start_x, self.start_y, cx, cy]
-            # normalize coords for PIL (left,top,right,bottom)
-            x0, y0 = min(shape[0], shape[2]), min(shape[1], shape[3])
-            x1, y1 = max(shape[0], shape[2]), max(shape[1], shape[3])
-            if self.mode == "rect":
-                if self.fill_color:
-                    draw.rectangle([x0, y0, x1, y1], outline=self.color, fill=self.fill_color, width=2)
-                else:
-                    draw.rectangle([x0, y0, x1, y1], outline=self.color, width=2)
-            else:
-                if self.fill_color:
-                    draw.ellipse([x0, y0, x1, y1], outline=self.color, fill=self.fill_color, width=2)
-                else:
-                    draw.ellipse([x0, y0, x1, y1], outline=self.color, width=2)
+            dirty = self.doc.shape(self.mode, self.start_x, self.start_y, cx, cy,
+                                   outline=self.color, fill=self.fill_color, width=2)
 
             # 一時表示の削除
             try:
@@ -308,12 +346,10 @@ class Editor:
             except Exception:
                 pass
             self.temp_shape = None
-            self.update_canvas()
-            return
+            self.refresh(dirty)
 
-        # 選択モードの解除（方式Aでは編集しない）
-        if self.mode == "select":
-            return
+        # 操作を確定して履歴に積む（何も描いていなければ積まれない）
+        self.history.commit()
 
     # ---------------- パン・ズーム ----------------
     def zoom_event(self, event):
@@ -327,10 +363,10 @@ class Editor:
             else:
                 scale = 0.9
         # zoom の中心を画面上のマウスポイントに合わせる（簡易）
-        # 実装：ズーム倍率更新のみ（表示は update_canvas で反映）
+        # 実装：ズーム倍率更新のみ（合成はそのまま、表示範囲のタイルだけ作り直す）
         # より高度なアンカーズームが必要なら追加実装可
         self.zoom *= scale
-        self.update_canvas()
+        self.update_view()
 
     def pan_start(self, event):
         self.pan_x = event.x
@@ -340,66 +376,111 @@ class Editor:
         self.offset_x += event.x - self.pan_x
         self.offset_y += event.y - self.pan_y
         self.pan_x, self.pan_y = event.x, event.y
-        self.update_canvas()
+        # 合成済みのタイルを動かすだけ（再合成しない）
+        self.view.move_to(self.offset_x, self.offset_y)
+        self.draw_grid()
 
     # ---------------- 描画更新 ----------------
     def merge_layers(self):
-        base = Image.new("RGBA", (self.w, self.h), (255, 255, 255, 255))  # 背景白
-        for l in self.layers:
-            base.alpha_composite(l.image)
-        return base
+        # 合成はキャッシュ（アクティブより下 / 上）と合わせて最大3枚
+        return self.doc.render()
+
+    def refresh(self, rect):
+        """描画で変わった矩形（画像座標）だけ再合成し、重なるタイルだけ転送し直す"""
+        rect = self.doc.recompose(rect)
+        if rect is not None:
+            self.view.render(self.doc.merged, self.zoom,
+                             self.offset_x, self.offset_y, rect)
+
+    def request_refresh(self, rect=None):
+        """表示更新を予約する。次の表示フレーム（root.after）でまとめて1回だけ行う"""
+        self.pending_dirty = union(self.pending_dirty, rect)
+        if self.frame_job is None:
+            self.frame_job = self.root.after(self.frame_ms, self.on_frame)
+
+    def on_frame(self):
+        self.frame_job = None
+        if self.stroke is not None:
+            dirty = self.doc.stroke(self.stroke, self.color)
+            self.pending_dirty = union(self.pending_dirty, dirty)
+        if self.pending_dirty is not None:
+            rect, self.pending_dirty = self.pending_dirty, None
+            self.refresh(rect)
+
+    def flush_frame(self):
+        """予約中の表示更新をすぐに行う"""
+        if self.frame_job is not None:
+            self.root.after_cancel(self.frame_job)
+        self.on_frame()
 
     def update_canvas(self, show_temp=True):
-        """Canvas 上の背景画像（タグ 'bg'）だけを差し替える実装に変更。
-           こうすることで、temp_shape のような一時オブジェクトは Canvas 上に残る。
+        """全体を再合成して表示し直す（レイヤー構成・ズーム・パンが変わったとき用）。
+           背景はタイル（タグ 'bg'）として Canvas の最下層に置くので、
+           temp_shape のような一時オブジェクトは Canvas 上に残る。
         """
-        merged = self.merge_layers()
-        # 表示サイズに合わせてリサイズ（ズーム）
-        disp_w = max(1, int(self.w * self.zoom))
-        disp_h = max(1, int(self.h * self.zoom))
-        resized = merged.resize((disp_w, disp_h), resample=Image.BILINEAR)
-        self.tk_img = ImageTk.PhotoImage(resized)
-
-        # 背景画像だけ差し替える（タグ 'bg'）
-        # 既存の bg を削除
-        try:
-            self.canvas.delete("bg")
-        except Exception:
-            pass
-
-        self.canvas.create_image(self.offset_x, self.offset_y,
-                                 image=self.tk_img, anchor="nw", tags=("bg",))
-
-        # グリッドを描画（タグ 'grid'）
-        self.canvas.delete("grid")
-        if self.use_grid and self.grid_size > 0:
-            step = int(self.grid_size * self.zoom)
-            if step > 0:
-                # 垂直線
-                x_start = self.offset_x % step
-                x = x_start
-                while x < disp_w + abs(self.offset_x):
-                    self.canvas.create_line(x, 0, x, disp_h + abs(self.offset_y), fill="#cccccc", tags=("grid",))
-                    x += step
-                # 水平線
-                y_start = self.offset_y % step
-                y = y_start
-                while y < disp_h + abs(self.offset_y):
-                    self.canvas.create_line(0, y, disp_w + abs(self.offset_x), y, fill="#cccccc", tags=("grid",))
-                    y += step
+        self.doc.recompose()
+        self.update_view(changed=True)
 
         # note: temp_shape（プレビュー用）は delete("all") しないので残ります
 
+    def update_view(self, changed=False):
+        """合成済みの画像から、見えている範囲のタイルとグリッドを表示し直す
+        （changed: 合成し直した直後。ズームだけなら False でミップマップはそのまま）"""
+        self.view.render(self.doc.merged, self.zoom, self.offset_x, self.offset_y,
+                         changed=changed)
+        self.draw_grid()
+
+    def draw_grid(self):
+        """グリッドを表示（キャッシュした1枚の画像を置き直すだけ、タグ 'grid'）"""
+        if self.use_grid and self.grid_size > 0:
+            self.grid.show(int(self.grid_size * self.zoom), self.offset_x, self.offset_y,
+                           self.view.viewport_size())
+        else:
+            self.grid.hide()
+
     # ---------------- 保存 ----------------
     def save(self):
-        path = filedialog.asksaveasfilename(defaultextension=".png",
-                                            filetypes=[("PNG", "*.png"), ("All files", "*.*")])
+        path = filedialog.asksaveasfilename(defaultextension=EXTENSION,
+                                            filetypes=[("プロジェクト", "*" + EXTENSION),
+                                                       ("PNG", "*.png"), ("All files", "*.*")])
         if not path:
             return
+        if self.doc.loading:
+            print("画像の読み込み中は保存できません")
+            return
+        if path.endswith(EXTENSION):
+            self.save_project(path)
+            return
         img = self.merge_layers()
         img.save(path)
         print("保存しました:", path)
 
+    def save_project(self, path):
+        """レイヤーを保ったまま保存（同じファイルへの上書きは変わったレイヤーだけ書く）"""
+        if self.doc.loading:
+            print("画像の読み込み中は保存できません")
+            return
+        if self.project is None:
+            self.project = Project(path)
+        written = self.project.save(self.layers, (self.w, self.h), self.active_layer, path=path)
+        print("保存しました: %s（%d / %d レイヤーを書き込み）" % (path, written, len(self.layers)))
+
+    def open_project(self):
+        path = filedialog.askopenfilename(filetypes=[("プロジェクト", "*" + EXTENSION)])
+        if not path:
+            return
+        project, layers, (w, h), active = Project.open(path)
+        if self.project is not None:
+            self.project.close()
+        # レイヤーの画素は表示に必要になったときに展開される
+        self.project = project
+        self.w, self.h = w, h
+        self.doc = Document(w, h, layers, min(active, len(layers) - 1))
+        # 前の文書の読み込みは捨てる（待ち行列の分が新しいサイズでデコードされないように）
+        self.importer.close()
+        self.importer = ImageImporter((w, h))
+        self.update_canvas()
+
 
 if __name__ == "__main__":
     root = tk.Tk()
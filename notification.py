@@ -0,0 +1,189 @@
+import json, queue, shutil, socket, subprocess, sys, threading, time
+from collections import deque
+
+
+# ----------------------------
+# 通知バックエンド
+# ----------------------------
+# バックエンドは send(notification) を1つ持つだけのクラス。
+# notification は {'kind', 'title', 'subtitle', 'message', 'sound', ...} の dict で、
+# kind は "notify" / "speak" / "dialog" のいずれか。
+
+class OsascriptBackend:
+    """macOS 通知センター / say / ダイアログ"""
+
+    def __init__(self):
+        self.dialogs = []   # 開いているダイアログのプロセス（終わったものは次の send で回収）
+
+    def reap(self):
+        """終了したダイアログのプロセスを回収する（ゾンビを残さない）"""
+        self.dialogs = [p for p in self.dialogs if p.poll() is None]
+
+    def send(self, n):
+        self.reap()
+        if n['kind'] == "speak":
+            subprocess.run(['say', n['message']], check=False)
+        elif n['kind'] == "dialog":
+            script = (f'display dialog "{n["message"]}" with title "{n["title"]}" '
+                      f'buttons {{"OK"}} default button "OK" with icon caution')
+            # モーダルなので終了を待たない（ディスパッチャを止めない）
+            self.dialogs.append(subprocess.Popen(['osascript', '-e', script]))
+        else:
+            script = (f'display notification "{n["message"]}" with title "{n["title"]}" '
+                      f'subtitle "{n["subtitle"]}"')
+            if n['sound']:
+                script += ' sound name "Glass"'
+            subprocess.run(['osascript', '-e', script], check=False)
+
+
+class NotifySendBackend:
+    """Linux デスクトップ通知（notify-send / spd-say）"""
+
+    def send(self, n):
+        if n['kind'] == "speak":
+            if shutil.which("spd-say"):
+                subprocess.run(['spd-say', n['message']], check=False)
+            return
+        body = f"{n['subtitle']}\n{n['message']}" if n['subtitle'] else n['message']
+        urgency = "critical" if n['kind'] == "dialog" else "normal"
+        subprocess.run(['notify-send', '-u', urgency, n['title'], body], check=False)
+
+
+class FileSinkBackend:
+    """通知を JSONL ファイルに追記する（テスト・記録用）"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, n):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(n, ensure_ascii=False) + "\n")
+
+
+class SocketSinkBackend:
+    """通知を localhost の UDP ソケットへ JSON で送る（テスト・連携用）"""
+
+    def __init__(self, host="127.0.0.1", port=9999):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, n):
+        self.sock.sendto(json.dumps(n, ensure_ascii=False).encode("utf-8"), self.address)
+
+
+class ConsoleBackend:
+    """標準エラーに出すだけ（通知手段がない環境用）"""
+
+    def send(self, n):
+        print(f"🔔 [{n['title']}] {n['subtitle']} {n['message']}", file=sys.stderr)
+
+
+def default_backend():
+    """実行環境に合わせたバックエンド"""
+    if sys.platform == "darwin":
+        return OsascriptBackend()
+    if shutil.which("notify-send"):
+        return NotifySendBackend()
+    return ConsoleBackend()
+
+
+# ----------------------------
+# 非同期ディスパッチャ
+# ----------------------------
+class AsyncNotifier:
+    """通知をバックグラウンドスレッドで送る通知クラス
+
+    SystemNotifier と同じ notify / speak / notify_with_dialog を持つが、
+    キューに積むだけで即座に戻る。キューが満杯なら捨てる（呼び出し側は待たない）。
+    同じ内容（kind, title, message）の通知は、未送信のものがあるか、
+    coalesce_window 秒以内に送ったばかりなら1つにまとめる。
+    """
+
+    def __init__(self, backend=None, maxsize=16, coalesce_window=5.0, clock=time.monotonic):
+        self.backend = backend if backend is not None else default_backend()
+        self.coalesce_window = coalesce_window
+        self.clock = clock
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._pending = set()       # キューにある通知のキー
+        self._last_sent = {}        # キー → 最後に送った時刻
+        self._latencies = deque(maxlen=256)
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # SystemNotifier 互換のインターフェース
+    def notify(self, message, title="集中力モニター", subtitle="", sound=True):
+        return self._enqueue("notify", message, title, subtitle, sound)
+
+    def speak(self, text):
+        return self._enqueue("speak", text, "", "", False)
+
+    def notify_with_dialog(self, message, title="警告"):
+        return self._enqueue("dialog", message, title, "", False)
+
+    def _enqueue(self, kind, message, title, subtitle, sound):
+        key = (kind, title, message)
+        now = self.clock()
+        with self._lock:
+            last = self._last_sent.get(key)
+            if key in self._pending or (last is not None and now - last < self.coalesce_window):
+                self.coalesced += 1
+                return True
+            n = {'kind': kind, 'title': title, 'subtitle': subtitle,
+                 'message': message, 'sound': sound, 'enqueued_at': now}
+            try:
+                self._queue.put_nowait(n)
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._pending.add(key)
+        return True
+
+    def _run(self):
+        while True:
+            n = self._queue.get()
+            if n is None:
+                break
+            key = (n['kind'], n['title'], n['message'])
+            try:
+                self.backend.send(n)
+                ok = True
+            except Exception as e:
+                print(f"❌ 通知エラー: {e}", file=sys.stderr)
+                ok = False
+            done = self.clock()
+            with self._lock:
+                self._pending.discard(key)
+                if ok:
+                    self.sent += 1
+                    self._last_sent[key] = done
+                    self._latencies.append(done - n['enqueued_at'])
+                else:
+                    self.failed += 1
+
+    def metrics(self):
+        """送信数と配信レイテンシ（キュー投入 → 送信完了、ミリ秒）"""
+        with self._lock:
+            lat = sorted(self._latencies)
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'queued': self._queue.qsize(),
+                'latency_mean_ms': sum(lat) / len(lat) * 1000 if lat else 0.0,
+                'latency_p95_ms': lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000 if lat else 0.0,
+                'latency_max_ms': lat[-1] * 1000 if lat else 0.0,
+            }
+
+    def close(self, timeout=2.0):
+        """キューに残った通知を送り切ってからスレッドを止める"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
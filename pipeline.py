@@ -0,0 +1,235 @@
+import argparse, threading, time
+from collections import deque
+import cv2
+
+from eyeDetection import GazeMonitorWithNotification
+from profiling import StageProfiler, add_metrics_arguments
+from eventlog import add_log_arguments, configure_event_log
+
+
+class LatestQueue:
+    """容量付きキュー。満杯なら古いものを捨てる（最新フレーム優先）"""
+
+    def __init__(self, maxsize=1):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """次の要素を取り出す。閉じられたかタイムアウトなら None"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class FrameGrabber:
+    """カメラ読み込み専用スレッド
+
+    cap.read() を別スレッドで回し続け、ドライバのバッファに古いフレームが
+    溜まらないようにする。利用側は read() で常に最新フレームを受け取る。
+    """
+
+    def __init__(self, source=0, stats=None):
+        self.cap = cv2.VideoCapture(source)
+        self.frames = LatestQueue(maxsize=1)
+        self.stats = stats
+        self._stop = threading.Event()
+        self._seq = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                t_capture = time.perf_counter()
+                if self.stats is not None:
+                    self.stats.record("capture", t_capture - t0)
+                self.frames.put((self._seq, t_capture, frame))
+                self._seq += 1
+        finally:
+            # 読み込み中に別スレッドから release しないよう、このスレッドで閉じる
+            self.cap.release()
+            self.frames.close()
+
+    def read(self, timeout=1.0):
+        """(seq, キャプチャ時刻, frame) を返す。終了していれば None"""
+        return self.frames.get(timeout)
+
+    def stop(self):
+        """停止を指示して待つ（カメラは読み込みスレッドが終わるときに閉じる）"""
+        self._stop.set()
+        if self._thread.ident is None:
+            # start() していなければ自分で閉じる
+            self.cap.release()
+        else:
+            self._thread.join(timeout=1.0)
+
+
+class GazePipeline:
+    """キャプチャ → 推論 → 判定/描画 を別スレッドで流すパイプライン
+
+    各ステージ間は容量1の LatestQueue でつなぎ、処理が追いつかない場合は
+    古いフレームを捨てて最新のものを処理する。表示（cv2.imshow）は
+    メインスレッドで poll() を呼んで行う。
+    """
+
+    def __init__(self, monitor=None, source=0, profiler=None):
+        # ステージ間の待ち時間と、monitor 内部のステージを同じプロファイラに集める
+        self.stats = profiler if profiler is not None else StageProfiler()
+        self.monitor = (monitor if monitor is not None
+                        else GazeMonitorWithNotification(profiler=self.stats))
+        self.grabber = FrameGrabber(source, stats=self.stats)
+        self.inferred = LatestQueue(maxsize=1)
+        self.rendered = LatestQueue(maxsize=1)
+        self._threads = [
+            threading.Thread(target=self._infer_loop, daemon=True),
+            threading.Thread(target=self._decide_loop, daemon=True),
+        ]
+
+    def start(self):
+        self.grabber.start()
+        for t in self._threads:
+            t.start()
+        return self
+
+    def _infer_loop(self):
+        # FaceMesh はこのスレッドからのみ使う
+        scheduler = self.monitor.scheduler
+        while True:
+            item = self.grabber.read()
+            if item is None:
+                if self.grabber.frames.closed:
+                    break
+                continue
+            seq, t_capture, frame = item
+            now = self.monitor.clock()
+            if scheduler is not None and not scheduler.due(now):
+                # 推論を間引くフレームは直前の結果で描画だけ行う
+                self.inferred.put((seq, t_capture, frame, self.monitor.last_gaze_info, True))
+                continue
+
+            t0 = time.perf_counter()
+            self.stats.record("queue_wait", t0 - t_capture)
+            gaze_info = self.monitor.estimate_gaze(frame)
+            self.stats.record("inference", time.perf_counter() - t0)
+            self.monitor.observe(now, gaze_info)
+            self.inferred.put((seq, t_capture, frame, gaze_info, False))
+        self.inferred.close()
+
+    def _decide_loop(self):
+        while True:
+            item = self.inferred.get(timeout=1.0)
+            if item is None:
+                if self.inferred.closed:
+                    break
+                continue
+            seq, t_capture, frame, gaze_info, skipped = item
+            t0 = time.perf_counter()
+            if skipped:
+                self.monitor.skip()
+            else:
+                self.monitor.update(gaze_info)
+                t_decision = time.perf_counter()
+                self.stats.record("decision", t_decision - t0)
+                self.stats.record("glass_to_decision", t_decision - t_capture)
+                t0 = t_decision
+
+            annotated = self.monitor.annotate(frame, gaze_info)
+            self.stats.record("annotate", time.perf_counter() - t0)
+            self.rendered.put((seq, t_capture, annotated))
+            self.stats.frame()
+        self.rendered.close()
+
+    def poll(self, timeout=0.1):
+        """描画済みの最新フレームを返す（メインスレッドから呼ぶ）"""
+        item = self.rendered.get(timeout)
+        if item is None:
+            return None
+        seq, t_capture, annotated = item
+        self.stats.record("glass_to_display", time.perf_counter() - t_capture)
+        return annotated
+
+    @property
+    def finished(self):
+        return self.rendered.closed
+
+    def dropped(self):
+        """ステージ間で捨てたフレーム数"""
+        return {
+            'capture->inference': self.grabber.frames.dropped,
+            'inference->decision': self.inferred.dropped,
+            'decision->display': self.rendered.dropped,
+        }
+
+    def stop(self):
+        self.grabber.stop()
+        for t in self._threads:
+            t.join(timeout=1.0)
+
+
+def print_report(pipeline):
+    pipeline.stats.print_report()
+    print(f"破棄フレーム数: {pipeline.dropped()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="目線モニター（パイプライン版）")
+    add_metrics_arguments(parser)
+    add_log_arguments(parser)
+    args = parser.parse_args(argv)
+
+    log_listener = configure_event_log(args.log_file, args.log_level)
+    pipeline = GazePipeline().start()
+    if args.metrics_port is not None:
+        pipeline.stats.serve(args.metrics_port)
+
+    print("=== 目線モニター開始（パイプライン版） ===")
+    print("'q'キーで終了")
+    print()
+
+    while not pipeline.finished:
+        annotated = pipeline.poll()
+        if annotated is not None:
+            cv2.imshow('Gaze Monitor', annotated)
+
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    pipeline.stop()
+    pipeline.monitor.close()
+    log_listener.stop()
+    cv2.destroyAllWindows()
+    if args.metrics_file:
+        pipeline.stats.write(args.metrics_file)
+    print_report(pipeline)
+
+
+if __name__ == "__main__":
+    main()
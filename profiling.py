@@ -0,0 +1,243 @@
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ヒストグラムのバケット：2 のべき乗ごとに 2**SUB_BITS 分割（相対誤差 12.5% 以内）
+SUB_BITS = 3
+SUB_BUCKETS = 1 << SUB_BITS
+NUM_BUCKETS = 64 * SUB_BUCKETS
+
+
+def _bucket(ns):
+    """ナノ秒 → バケット番号（整数演算のみ）"""
+    if ns < 2 * SUB_BUCKETS:
+        return max(0, ns)
+    shift = ns.bit_length() - SUB_BITS - 1
+    return shift * SUB_BUCKETS + (ns >> shift)
+
+
+def _bucket_upper(idx):
+    """バケットの上限（ナノ秒）"""
+    if idx < 2 * SUB_BUCKETS:
+        return idx + 1
+    shift = idx // SUB_BUCKETS - 1
+    return (idx - shift * SUB_BUCKETS + 1) << shift
+
+
+class Histogram:
+    """対数バケットのレイテンシヒストグラム（記録は O(1)、確保なし）"""
+
+    __slots__ = ("counts", "count", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record_ns(self, ns):
+        self.counts[min(_bucket(ns), NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, q):
+        """q（0〜100）パーセンタイル（秒、バケット上限で近似）"""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return min(_bucket_upper(idx), self.max_ns) / 1e9
+        return self.max_ns / 1e9
+
+
+class _StageTimer:
+    """with profiler.stage(name): の計測用（stage() のたびに作る。開始時刻を呼び出しごとに持つ）"""
+
+    __slots__ = ("lock", "histogram", "t0")
+
+    def __init__(self, lock, histogram):
+        self.lock = lock
+        self.histogram = histogram
+        self.t0 = 0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        ns = time.perf_counter_ns() - self.t0
+        with self.lock:
+            self.histogram.record_ns(ns)
+        return False
+
+
+class StageProfiler:
+    """ステージ別の処理時間ヒストグラムと FPS を集計する
+
+    eyeDetection / eyeSettingsControl.gaze_loop / pipeline で共通に使う。
+    同じステージ名を複数スレッドから同時に、または入れ子で計測してもよい
+    （計測は呼び出しごと、記録はロックで保護）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.frames = 0
+        self.started = time.perf_counter()
+
+    def _histogram(self, name):
+        h = self._histograms.get(name)
+        if h is None:
+            with self._lock:
+                h = self._histograms.setdefault(name, Histogram())
+        return h
+
+    def stage(self, name):
+        return _StageTimer(self._lock, self._histogram(name))
+
+    def record_ns(self, name, ns):
+        h = self._histogram(name)
+        with self._lock:
+            h.record_ns(ns)
+
+    def record(self, name, seconds):
+        self.record_ns(name, int(seconds * 1e9))
+
+    def frame(self):
+        """1フレーム処理したことを記録（FPS 計算用）"""
+        self.frames += 1
+
+    def fps(self):
+        elapsed = time.perf_counter() - self.started
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self):
+        """{'fps', 'frames', 'stages': {name: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}}"""
+        with self._lock:
+            stages = {
+                name: {
+                    'count': h.count,
+                    'mean_ms': h.total_ns / h.count / 1e6 if h.count else 0.0,
+                    'p50_ms': h.percentile(50) * 1000,
+                    'p95_ms': h.percentile(95) * 1000,
+                    'p99_ms': h.percentile(99) * 1000,
+                    'max_ms': h.max_ns / 1e6,
+                }
+                for name, h in list(self._histograms.items())
+            }
+        return {'fps': self.fps(), 'frames': self.frames, 'stages': stages}
+
+    def to_prometheus(self, prefix="gaze"):
+        """Prometheus のテキスト形式（summary）"""
+        snap = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_fps gauge",
+            f"{prefix}_fps {snap['fps']:.3f}",
+            f"# TYPE {prefix}_frames_total counter",
+            f"{prefix}_frames_total {snap['frames']}",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, s in snap['stages'].items():
+            for q, key in ((0.5, 'p50_ms'), (0.95, 'p95_ms'), (0.99, 'p99_ms')):
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} {s[key] / 1000:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {s["mean_ms"] * s["count"] / 1000:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """集計を JSON で書き出す"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def serve(self, port=9108, host="127.0.0.1"):
+        """http://host:port/metrics で Prometheus 形式を返すサーバをバックグラウンドで起動"""
+        profiler = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = profiler.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def print_report(self):
+        snap = self.snapshot()
+        print(f"\n=== ステージ別処理時間（{snap['fps']:.1f} FPS） ===")
+        for name, s in snap['stages'].items():
+            print(f"{name:>18}: p50 {s['p50_ms']:7.2f}ms | p95 {s['p95_ms']:7.2f}ms | "
+                  f"p99 {s['p99_ms']:7.2f}ms | 最大 {s['max_ms']:7.2f}ms | {s['count']}回")
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullProfiler:
+    """計測しないプロファイラ（既定。オーバーヘッドほぼゼロ）"""
+
+    _timer = _NullTimer()
+
+    def stage(self, name):
+        return self._timer
+
+    def record_ns(self, name, ns):
+        pass
+
+    def record(self, name, seconds):
+        pass
+
+    def frame(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def add_metrics_arguments(parser):
+    """計測関連のコマンドライン引数を追加"""
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="localhost のこのポートで /metrics（Prometheus 形式）を公開する")
+    parser.add_argument("--metrics-file", default=None,
+                        help="終了時にステージ別処理時間を JSON で書き出す")
+
+
+def profiler_from_args(args):
+    """引数で計測が有効なら StageProfiler を作ってエンドポイントを開く。無効なら NULL_PROFILER"""
+    if args.metrics_port is None and args.metrics_file is None:
+        return NULL_PROFILER
+    profiler = StageProfiler()
+    if args.metrics_port is not None:
+        profiler.serve(args.metrics_port)
+        print(f"📈 メトリクス: http://127.0.0.1:{args.metrics_port}/metrics")
+    return profiler
+
+
+def finish_profiler(profiler, args):
+    """終了時の書き出しとレポート表示"""
+    if profiler is NULL_PROFILER:
+        return
+    if args.metrics_file:
+        profiler.write(args.metrics_file)
+    profiler.print_report()
@@ -0,0 +1,198 @@
+import json, mmap, os, struct, zlib
+
+from PIL import Image, ImageDraw
+
+# ファイル構成:
+#   ヘッダー（MAGIC, 索引の位置, 索引の長さ）
+#   レイヤーのチャンク（RGBA の生データを zlib 圧縮）... 追記されていく
+#   索引（JSON）: 文書サイズ・アクティブレイヤー・各レイヤーのチャンク位置と CRC
+# 上書き保存では変わったレイヤーのチャンクと新しい索引を末尾に追記し、最後に
+# ヘッダーの索引位置を書き換える（書き換え前に落ちても前回の内容が読める）。
+MAGIC = b"MKIMG\x00\x01\x00"
+HEADER = struct.Struct("<8sQQ")
+EXTENSION = ".mkimg"
+
+
+class LazyLayer:
+    """プロジェクトファイルから読むレイヤー。image に初めて触れたときにデコードする"""
+
+    loading = False
+    preview = None
+    generation = 0
+
+    def __init__(self, project, size):
+        self.project = project
+        self.size = size
+        self._image = None
+        self._draw = None
+
+    @property
+    def loaded(self):
+        return self._image is not None
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = Image.frombytes("RGBA", self.size, self.project.read(self))
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self._draw = None
+
+    @property
+    def draw(self):
+        if self._draw is None:
+            self._draw = ImageDraw.Draw(self.image)
+        return self._draw
+
+
+class Project:
+    """レイヤー構成を保ったまま保存・読み込みするプロジェクトファイル
+
+    開くときは索引だけ読み、レイヤーの画素は mmap から必要になったときに展開する。
+    保存は前回保存時から変わったレイヤーだけ圧縮して追記する。変わったかどうかは
+    まずレイヤーの generation（描画・Undo のたびに増える）で判定し、増えていない
+    レイヤーは画素に触れない（展開も CRC の計算もしない）。増えていれば CRC で比べる。
+    不要になったチャンクが生きているチャンクより大きくなったら全体を書き直す。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = {}        # レイヤー -> (位置, 長さ, 生データの CRC)
+        self.generations = {}   # レイヤー -> 保存（読み込み）時の generation
+        self._file = None
+        self._mm = None
+
+    # ---- 読み込み ----
+    @classmethod
+    def open(cls, path):
+        """(プロジェクト, レイヤーのリスト, (幅, 高さ), アクティブレイヤー) を返す"""
+        project = cls(path)
+        index = project._map()
+        size = (index["width"], index["height"])
+        layers = []
+        for entry in index["layers"]:
+            layer = LazyLayer(project, size)
+            project.chunks[layer] = (entry["offset"], entry["length"], entry["crc"])
+            project.generations[layer] = layer.generation
+            layers.append(layer)
+        return project, layers, size, index.get("active", len(layers) - 1)
+
+    def _map(self):
+        """ファイルを mmap し、索引を返す"""
+        self.close()
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, offset, length = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError("プロジェクトファイルではありません: %s" % self.path)
+        return json.loads(self._mm[offset:offset + length])
+
+    def read(self, layer):
+        offset, length, _ = self.chunks[layer]
+        return zlib.decompress(self._mm[offset:offset + length])
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+        self._mm = self._file = None
+
+    # ---- 保存 ----
+    def _changed(self, layer):
+        """前回保存時から変わったレイヤーなら生データを返す（変わっていなければ None）"""
+        saved = self.chunks.get(layer)
+        if saved is None:
+            return layer.image.tobytes()
+        if self.generations.get(layer) == layer.generation:
+            return None
+        data = layer.image.tobytes()
+        if saved[2] == zlib.crc32(data):
+            # 描いて Undo した場合など、中身は同じ
+            self.generations[layer] = layer.generation
+            return None
+        return data
+
+    def save(self, layers, size, active=0, path=None):
+        """保存して、実際に圧縮・書き込みしたレイヤー数を返す"""
+        if path is not None and path != self.path:
+            # 別名で保存: 今のファイルから読んだチャンクは新しいファイルへコピーする
+            self.path = path
+            return self._rewrite(layers, size, active)
+
+        if self._mm is None or not os.path.exists(self.path):
+            return self._rewrite(layers, size, active)
+
+        live = sum(self.chunks[l][1] for l in layers if l in self.chunks)
+        garbage = len(self._mm) - HEADER.size - live
+        if garbage > max(live, 1 << 20):
+            return self._rewrite(layers, size, active)
+
+        # 変わったレイヤーだけ末尾に追記
+        written = 0
+        with open(self.path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            for layer in layers:
+                data = self._changed(layer)
+                if data is not None:
+                    self.chunks[layer] = self._write_chunk(f, data)
+                    self.generations[layer] = layer.generation
+                    written += 1
+            self._write_index(f, layers, size, active)
+        self._forget(layers)
+        self._map()
+        return written
+
+    def _rewrite(self, layers, size, active):
+        """全レイヤーを新しいファイルに書き直す（変わっていないレイヤーは圧縮済みのまま写す）"""
+        tmp = self.path + ".tmp"
+        chunks = {}
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, 0, 0))
+            for layer in layers:
+                data = self._changed(layer)
+                if data is None:
+                    offset, length, crc = self.chunks[layer]
+                    chunks[layer] = (f.tell(), length, crc)
+                    f.write(self._mm[offset:offset + length])
+                else:
+                    chunks[layer] = self._write_chunk(f, data)
+                    self.generations[layer] = layer.generation
+            self.chunks = chunks
+            self._forget(layers)
+            self._write_index(f, layers, size, active)
+        self.close()
+        os.replace(tmp, self.path)
+        self._map()
+        return len(layers)
+
+    def _write_chunk(self, f, data):
+        packed = zlib.compress(data, 6)
+        offset = f.tell()
+        f.write(packed)
+        return offset, len(packed), zlib.crc32(data)
+
+    def _write_index(self, f, layers, size, active):
+        index = {
+            'width': size[0],
+            'height': size[1],
+            'active': active,
+            'layers': [dict(zip(("offset", "length", "crc"), self.chunks[l])) for l in layers],
+        }
+        data = json.dumps(index).encode("utf-8")
+        offset = f.tell()
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        # 索引を書き終えてからヘッダーを差し替える
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, offset, len(data)))
+        f.flush()
+
+    def _forget(self, layers):
+        """もう文書にないレイヤーの記録を捨てる"""
+        keep = set(layers)
+        self.chunks = {l: c for l, c in self.chunks.items() if l in keep}
+        self.generations = {l: g for l, g in self.generations.items() if l in keep}
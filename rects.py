@@ -0,0 +1,49 @@
+# 矩形は (x0, y0, x1, y1) のタプル（x1, y1 は含まない）。空の場合は None。
+
+
+def union(a, b):
+    """2つの矩形を含む最小の矩形"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def intersect(a, b):
+    """共通部分（なければ None）"""
+    if a is None or b is None:
+        return None
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+
+def clip(r, w, h):
+    """画像 (w, h) の範囲に収める"""
+    return intersect(r, (0, 0, w, h))
+
+
+def inflate(r, n):
+    """各辺を n ピクセル広げる"""
+    if r is None:
+        return None
+    return r[0] - n, r[1] - n, r[2] + n, r[3] + n
+
+
+def points_bbox(points, pad=0):
+    """点列 [(x, y), ...] を含む矩形（pad だけ広げる）"""
+    xs = [int(p[0]) for p in points]
+    ys = [int(p[1]) for p in points]
+    return min(xs) - pad, min(ys) - pad, max(xs) + pad + 1, max(ys) + pad + 1
+
+
+def tiles_in(r, tile_size):
+    """矩形に重なるタイル番号 (tx, ty) を列挙"""
+    if r is None:
+        return
+    for ty in range(r[1] // tile_size, (r[3] - 1) // tile_size + 1):
+        for tx in range(r[0] // tile_size, (r[2] - 1) // tile_size + 1):
+            yield tx, ty
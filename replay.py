@@ -0,0 +1,197 @@
+import argparse, json, os, sys, time
+import contextlib
+import cv2
+
+from eyeDetection import GazeMonitorWithNotification
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v")
+
+
+class RecordingNotifier:
+    """通知を送らずに記録だけする通知クラス（ヘッドレス用）"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.events = []
+
+    def notify(self, message, title="集中力モニター", subtitle="", sound=True):
+        self.events.append({
+            't': self.clock(),
+            'title': title,
+            'subtitle': subtitle,
+            'message': message,
+        })
+        return True
+
+    def speak(self, text):
+        self.notify(text)
+
+    def notify_with_dialog(self, message, title="警告"):
+        self.notify(message, title=title)
+
+
+class VideoClock:
+    """動画の再生位置（秒）を現在時刻として返す時計
+
+    リプレイは CPU の速さで進むため、壁時計ではなく動画時刻で
+    通知間隔などを判定して結果を決定的にする。
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.frame_index = 0
+
+    def __call__(self):
+        return self.frame_index / self.fps
+
+
+def list_videos(path):
+    """動画ファイル、またはディレクトリ内の動画ファイル一覧（名前順）"""
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith(VIDEO_EXTENSIONS)
+        )
+    return [path]
+
+
+def replay_video(path, start=0, end=None, monitor_kwargs=None, warmup=0):
+    """動画1本を GUI なしで monitor() に通し、フレームごとの結果を返す
+
+    フレームごとに {'type': 'frame', ...} を、最後に {'type': 'summary', ...} を yield する。
+    warmup を指定すると start の warmup フレーム前から monitor に通し（方向の継続時間や
+    通知のクールダウンを途中から始めないため）、その間の結果は出力にも集計にも含めない。
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"動画が開けません: {path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    clock = VideoClock(fps)
+    notifier = RecordingNotifier(clock)
+    monitor = GazeMonitorWithNotification(
+        fps=fps, notifier=notifier, clock=clock, **(monitor_kwargs or {})
+    )
+
+    first = max(0, start - warmup)
+    if first:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    frame_index = first
+    frames = 0
+    detected = 0
+    base = None     # start の時点のカウンタ（ウォームアップ分を差し引く）
+    started = time.perf_counter()
+    try:
+        while end is None or frame_index < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if first:
+                # シーク位置は形式によって正確でないので、実際に読めた位置から数える
+                frame_index = max(0, int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1)
+                first = 0
+                if end is not None and frame_index >= end:
+                    break
+            if base is None and frame_index >= start:
+                base = (monitor.skipped_frames, monitor.total_frames,
+                        monitor.focused_frames, len(notifier.events))
+
+            clock.frame_index = frame_index
+            notification_count = monitor.notification_count
+            skipped_frames = monitor.skipped_frames
+            t0 = time.perf_counter()
+            monitor.monitor(frame)
+            elapsed = time.perf_counter() - t0
+            if base is None:
+                # ウォームアップ（状態を作るだけで出力しない）
+                frame_index += 1
+                continue
+
+            info = monitor.last_gaze_info
+            record = {
+                'type': 'frame',
+                'video': path,
+                'frame': frame_index,
+                't': round(clock(), 4),
+                'inferred': monitor.skipped_frames == skipped_frames,
+                'detected': info is not None,
+                'notified': monitor.notification_count > notification_count,
+                'elapsed_ms': round(elapsed * 1000, 3),
+            }
+            if info is not None:
+                detected += record['inferred']
+                record.update({
+                    'direction': info['direction'],
+                    'is_focused': bool(info['is_focused']),
+                    'gaze_x': float(info['gaze_x']),
+                    'gaze_y': float(info['gaze_y']),
+                })
+            yield record
+            frames += 1
+            frame_index += 1
+    finally:
+        cap.release()
+
+    wall = time.perf_counter() - started
+    if base is None:
+        base = (monitor.skipped_frames, monitor.total_frames,
+                monitor.focused_frames, len(notifier.events))
+    total_frames = monitor.total_frames - base[1]
+    focused_frames = monitor.focused_frames - base[2]
+    yield {
+        'type': 'summary',
+        'video': path,
+        'start': start,
+        'frames': frames,
+        'detected_frames': detected,
+        'skipped_frames': monitor.skipped_frames - base[0],
+        'total_frames': total_frames,
+        'focused_frames': focused_frames,
+        'focus_rate': (focused_frames / total_frames * 100) if total_frames > 0 else 0.0,
+        'notifications': notifier.events[base[3]:],
+        'elapsed_s': round(wall, 4),
+        'fps': round(frames / wall, 2) if wall > 0 else 0.0,
+    }
+
+
+def write_jsonl(records, out):
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="録画済み動画を GUI なしで視線モニターに通し、結果を JSONL で出力する")
+    parser.add_argument("input", help="動画ファイル、または動画を含むディレクトリ")
+    parser.add_argument("-o", "--output", help="出力先 JSONL（省略時は標準出力）")
+    parser.add_argument("--summary-only", action="store_true",
+                        help="フレームごとの結果を出さず、動画ごとの集計だけ出力する")
+    parser.add_argument("--full-rate", action="store_true",
+                        help="推論の間引きをせず全フレームを推論する")
+    args = parser.parse_args(argv)
+    monitor_kwargs = {'adaptive_rate': False} if args.full_rate else None
+
+    videos = list_videos(args.input)
+    if not videos:
+        print(f"❌ 動画が見つかりません: {args.input}", file=sys.stderr)
+        return 1
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        # monitor() の print が JSONL に混ざらないよう標準エラーへ逃がす
+        with contextlib.redirect_stdout(sys.stderr):
+            for path in videos:
+                records = replay_video(path, monitor_kwargs=monitor_kwargs)
+                if args.summary_only:
+                    records = (r for r in records if r['type'] == 'summary')
+                write_jsonl(records, out)
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class FrameRingBuffer:
+    """直近 window 枚のフレームを (window, H, W, 3) の配列1つで保持するリングバッファ
+
+    配列は最初に1回だけ確保し、cap.read() が次のスロットへ直接書き込む。
+    取り出しはすべてビュー（コピーなし）なので、上書きされる前に使うこと。
+    """
+
+    def __init__(self, window, height, width, channels=3, dtype=np.uint8):
+        self.window = window
+        self.frames = np.empty((window, height, width, channels), dtype)
+        self.count = 0      # これまでに書き込んだ総フレーム数
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    def slot(self):
+        """次に書き込むスロット（ビュー）"""
+        return self.frames[self.count % self.window]
+
+    def commit(self):
+        """slot() への書き込みを確定する"""
+        self.count += 1
+
+    def read(self, cap):
+        """cap.read() で次のスロットへ直接読み込む。(ret, frame ビュー) を返す"""
+        slot = self.slot()
+        ret, frame = cap.read(slot)
+        if not ret:
+            return False, None
+        if not np.shares_memory(frame, slot):
+            # サイズが合わず OpenCV が別配列を確保した場合
+            if frame.shape != slot.shape:
+                raise ValueError(f"フレームサイズが一致しません: {frame.shape} != {slot.shape}")
+            np.copyto(slot, frame)
+        self.commit()
+        return True, slot
+
+    def latest(self):
+        """最新フレーム（ビュー）。まだなければ None"""
+        if self.count == 0:
+            return None
+        return self.frames[(self.count - 1) % self.window]
+
+    def segments(self, n=None):
+        """直近 n 枚を古い順に並べた連続ブロックのビュー（1つか2つ）"""
+        n = len(self) if n is None else min(n, len(self))
+        if n == 0:
+            return []
+        end = self.count % self.window or self.window
+        start = end - n
+        if start >= 0:
+            return [self.frames[start:end]]
+        # 配列の末尾をまたぐ場合は2つに分かれる
+        return [self.frames[start:], self.frames[:end]]
+
+    def last(self, n=None):
+        """直近 n 枚を古い順に並べたフレームビューのリスト"""
+        return [frame for block in self.segments(n) for frame in block]
+
+    def ordered(self, out, n=None):
+        """直近 n 枚を古い順に out（(n, H, W, 3)）へコピーする。連続配列が必要な場合用"""
+        i = 0
+        for block in self.segments(n):
+            out[i:i + len(block)] = block
+            i += len(block)
+        return out[:i]
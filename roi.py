@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+from profiling import NULL_PROFILER
+
+# 顔の外接矩形を求めるのに使う端のランドマーク（額・あご・右頬・左頬）
+FACE_BOUND_ROWS = [10, 152, 234, 454]
+
+
+def run_face_mesh(face_mesh, image, profiler=NULL_PROFILER):
+    """BGR 画像で FaceMesh を実行し、最初の顔のランドマークを返す（なければ None）"""
+    with profiler.stage("cvtColor"):
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    with profiler.stage("face_mesh"):
+        results = face_mesh.process(rgb)
+    if not results.multi_face_landmarks:
+        return None
+    return results.multi_face_landmarks[0].landmark
+
+
+def run_face_mesh_all(face_mesh, image, profiler=NULL_PROFILER):
+    """BGR 画像で FaceMesh を実行し、見つかった全員のランドマークをリストで返す"""
+    with profiler.stage("cvtColor"):
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    with profiler.stage("face_mesh"):
+        results = face_mesh.process(rgb)
+    return [face.landmark for face in results.multi_face_landmarks or ()]
+
+
+class FaceRoiTracker:
+    """前フレームの顔位置から切り出し範囲（ROI）を決めて FaceMesh を実行する
+
+    顔の矩形は padding 分だけ広げ、smoothing で前フレームと混ぜて揺れを抑える。
+    ROI 内で顔を見失ったときだけ、同じフレームをフレーム全体で探し直す。
+    enabled=False なら常にフレーム全体で推論する。
+    """
+
+    def __init__(self, enabled=True, padding=0.5, smoothing=0.6, min_size=128):
+        self.enabled = enabled
+        self.padding = padding        # 顔サイズに対する余白の割合（片側）
+        self.smoothing = smoothing    # 新しい矩形の重み（1.0 で平滑化なし）
+        self.min_size = min_size      # 切り出しの最小サイズ（ピクセル）
+        self.box = None               # 平滑化済みの顔矩形 [x0, y0, x1, y1]
+        self.full_searches = 0
+        self.roi_hits = 0
+
+    def reset(self):
+        self.box = None
+
+    def crop_rect(self, w, h):
+        """現在の ROI を整数の (x0, y0, x1, y1) で返す。追跡中でなければフレーム全体"""
+        if self.box is None:
+            return 0, 0, w, h
+        x0, y0, x1, y1 = self.box
+        pad = self.padding * max(x1 - x0, y1 - y0)
+        # 最小サイズに満たない場合は中心を保ったまま広げる
+        half = max(self.min_size / 2, (max(x1 - x0, y1 - y0) / 2) + pad)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        x0 = max(0, int(cx - half))
+        y0 = max(0, int(cy - half))
+        x1 = min(w, int(cx + half))
+        y1 = min(h, int(cy + half))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return 0, 0, w, h
+        return x0, y0, x1, y1
+
+    def process(self, frame, face_mesh, profiler=NULL_PROFILER):
+        """ROI で FaceMesh を実行
+
+        戻り値: (ランドマーク, (x0, y0, 切り出し幅, 切り出し高さ))。顔がなければ None。
+        """
+        h, w = frame.shape[:2]
+        if self.enabled and self.box is not None:
+            x0, y0, x1, y1 = self.crop_rect(w, h)
+            landmarks = run_face_mesh(face_mesh, frame[y0:y1, x0:x1], profiler)
+            if landmarks is not None:
+                self.roi_hits += 1
+                return landmarks, (x0, y0, x1 - x0, y1 - y0)
+            # 見失った → フレーム全体で探し直す
+            self.reset()
+
+        self.full_searches += 1
+        landmarks = run_face_mesh(face_mesh, frame, profiler)
+        if landmarks is None:
+            return None
+        return landmarks, (0, 0, w, h)
+
+    def update(self, bound_points):
+        """FACE_BOUND_ROWS のピクセル座標（元フレーム系）から顔矩形を更新"""
+        if not self.enabled:
+            return
+        xy = bound_points[:, :2]
+        box = np.concatenate([xy.min(axis=0), xy.max(axis=0)])
+        if self.box is None:
+            self.box = box
+        else:
+            self.box = self.smoothing * box + (1.0 - self.smoothing) * self.box
@@ -0,0 +1,58 @@
+import math
+
+
+class AdaptiveScheduler:
+    """視線の安定度に応じて推論間隔を変えるスケジューラ
+
+    状態（方向）が変わらず視線ベクトルの動きも小さい間は、推論間隔を
+    growth 倍ずつ max_fps → min_fps まで伸ばす。状態が変わるか大きく
+    動いた場合、または顔を見失った場合は、すぐに max_fps に戻す。
+    due() は予定時刻より tolerance × 最短間隔 だけ早いフレームも通す
+    （カメラの揺らぎや動画時刻の丸めで、最高レートのフレームを落とさないため）。
+    """
+
+    def __init__(self, max_fps=30, min_fps=5, growth=1.25, stable_motion=0.02, tolerance=0.25):
+        self.set_max_fps(max_fps)
+        self.max_interval = 1.0 / min_fps
+        self.growth = growth
+        self.stable_motion = stable_motion    # これ未満の動きは「安定」とみなす
+        self.tolerance = tolerance            # 早着を許す幅（最短間隔に対する割合）
+        self.interval = self.min_interval
+        self.next_time = float("-inf")
+        self.last_state = None
+        self.last_vector = None
+
+    def set_max_fps(self, fps):
+        self.min_interval = 1.0 / max(1, fps)
+
+    def due(self, now):
+        """now の時点で推論すべきか"""
+        return now >= self.next_time - self.tolerance * self.min_interval
+
+    def wait_time(self, now):
+        """次の推論までの待ち時間（秒）"""
+        return max(0.0, self.next_time - now)
+
+    def observe(self, now, state=None, vector=None):
+        """推論結果を反映して次の推論時刻を決める（vector=None は顔なし）"""
+        stable = (
+            vector is not None
+            and self.last_vector is not None
+            and state == self.last_state
+            and math.hypot(vector[0] - self.last_vector[0],
+                           vector[1] - self.last_vector[1]) < self.stable_motion
+        )
+        if stable:
+            self.interval = min(self.max_interval, self.interval * self.growth)
+        else:
+            self.interval = self.min_interval
+
+        self.last_state = state
+        self.last_vector = vector
+        self.next_time = now + self.interval
+        return self.interval
+
+    @property
+    def rate(self):
+        """現在の推論レート（fps）"""
+        return 1.0 / self.interval
@@ -0,0 +1,29 @@
+from collections import namedtuple
+
+# sensitivity: 画面中心からの移動倍率（600 で等倍）
+# dead_zone: 中心で止める範囲（正規化座標）
+# fps: 推論の最大 FPS
+GazeSettings = namedtuple("GazeSettings", ["sensitivity", "dead_zone", "fps"])
+
+DEFAULT_SETTINGS = GazeSettings(sensitivity=600.0, dead_zone=0.1, fps=30)
+
+
+class SettingsChannel:
+    """UI スレッドからワーカースレッドへ設定を渡す
+
+    設定は変更不可の GazeSettings で、変わるたびに新しいものを作って current を
+    差し替える（publish は UI スレッドだけから呼ぶ）。ワーカーは1フレームに1回
+    current を読むだけでよく、ロックも Tk（Tcl）の呼び出しも要らない。
+    """
+
+    def __init__(self, initial=DEFAULT_SETTINGS):
+        self.current = initial
+        self.version = 0
+
+    def publish(self, **changes):
+        """一部の値を変えた新しい設定を公開し、それを返す"""
+        snapshot = self.current._replace(**changes)
+        if snapshot != self.current:
+            self.current = snapshot
+            self.version += 1
+        return snapshot
@@ -0,0 +1,53 @@
+from rects import points_bbox
+
+
+class Stroke:
+    """フリーハンドの1ストローク。マウスの移動をためておき、まとめて折れ線で描く
+
+    add() で点を追加し、表示フレームごとに take() でたまった点を取り出して
+    draw() で1本の折れ線として描く。継ぎ目と端は丸くする。
+    smoothing > 0 なら入力点を指数移動平均でならす（手ぶれ補正、0〜1）。
+    """
+
+    def __init__(self, x, y, width, smoothing=0.0):
+        self.width = width
+        self.smoothing = smoothing
+        self.pending = [(x, y)]     # 先頭は前回描いた最後の点（つなぎ目）
+        self.smoothed = (x, y)
+        self.started = False        # まだ1度も描いていない（始点の丸を描く）
+
+    def add(self, x, y):
+        s = self.smoothing
+        if s > 0:
+            x = s * self.smoothed[0] + (1.0 - s) * x
+            y = s * self.smoothed[1] + (1.0 - s) * y
+        self.smoothed = (x, y)
+        p = (int(round(x)), int(round(y)))
+        if p != self.pending[-1]:
+            self.pending.append(p)
+
+    def finish(self, x, y):
+        """最後の点はならさずに入れる（離した位置で終わるように）"""
+        if (x, y) != self.pending[-1]:
+            self.pending.append((x, y))
+
+    def take(self):
+        """描くべき点と、その範囲（描画前の履歴保存・再描画用）を返す。なければ None"""
+        if len(self.pending) < 2 and self.started:
+            return None
+        points = self.pending
+        self.pending = [points[-1]]
+        return points, points_bbox(points, self.width // 2 + 2)
+
+    def draw(self, draw, points, fill):
+        r = self.width / 2
+        if len(points) > 1:
+            draw.line(points, fill=fill, width=self.width, joint="curve")
+        elif self.width <= 2:
+            draw.point(points, fill=fill)
+        if self.width > 2:
+            # 端を丸く（前回分とのつなぎ目も同じ丸で埋まる）
+            caps = points[-1:] if self.started else [points[0], points[-1]]
+            for x, y in caps:
+                draw.ellipse([x - r, y - r, x + r, y + r], fill=fill)
+        self.started = True
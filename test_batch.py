@@ -0,0 +1,27 @@
+from batch import make_shards, merge_summaries, _run_shard
+from test_replay import FPS, FakeFaceMesh, write_video, gaze_levels
+
+
+def run(shards):
+    return merge_summaries([_run_shard(shard, FakeFaceMesh()) for shard in shards])[0]
+
+
+def test_chunked_summary_matches_unchunked(tmp_path):
+    # 各方向は 15 秒未満（ウォームアップより短い）。通知は CENTER が5秒続いたとき
+    path = write_video(tmp_path / "long.avi",
+                       gaze_levels([(7, "C"), (2, "L"), (12, "C"), (3, "-"), (6, "C"),
+                                    (1, "L"), (9, "C"), (4, "L"), (8, "C")]))
+    whole = run(make_shards([path]))
+    chunked_shards = make_shards([path], chunk_frames=int(10 * FPS))
+    assert len(chunked_shards) > 4
+    assert chunked_shards[1][4] == int(10 * FPS)   # 先頭以外はウォームアップ付き
+    chunked = run(chunked_shards)
+
+    assert whole['shards'] == 1
+    assert chunked['frames'] == whole['frames']
+    assert chunked['total_frames'] == whole['total_frames']
+    assert chunked['focused_frames'] == whole['focused_frames']
+    assert chunked['focus_rate'] == whole['focus_rate']
+    assert [n['t'] for n in chunked['notifications']] == \
+           [n['t'] for n in whole['notifications']]
+    assert whole['notifications']
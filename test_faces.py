@@ -0,0 +1,86 @@
+import numpy as np
+
+from landmarks import NUM_LANDMARKS
+from faces import FaceTracker, FaceStates, MultiLandmarkArray, CENTER, LEFT
+from roi import FACE_BOUND_ROWS
+from test_replay import FakePoint
+
+
+def box(x, y, size=100):
+    return [x, y, x + size, y + size]
+
+
+def track(tracker, boxes):
+    """検出の順に、振られた ID のリストを返す"""
+    slots = tracker.associate(np.array(boxes, np.float32).reshape(-1, 4))
+    return tracker.ids[slots].tolist()
+
+
+def test_ids_do_not_depend_on_detection_order():
+    tracker = FaceTracker(max_faces=3)
+    faces = [box(0, 0), box(300, 0), box(600, 0)]
+    first = track(tracker, faces)
+    assert sorted(first) == [0, 1, 2]
+    rng = np.random.default_rng(0)
+    for step in range(20):
+        order = rng.permutation(3)
+        # 少しずつ動きながら、検出の順番は毎フレーム変わる
+        moved = [[v + step * 3 for v in faces[i]] for i in order]
+        assert track(tracker, moved) == [first[i] for i in order]
+
+
+def test_ids_survive_short_dropouts():
+    tracker = FaceTracker(max_faces=2, max_missing=5)
+    a, b = track(tracker, [box(0, 0), box(300, 0)])
+    for _ in range(5):
+        assert track(tracker, [box(300, 0)]) == [b]
+    # max_missing フレーム以内に戻れば同じ ID
+    assert track(tracker, [box(5, 0), box(300, 0)]) == [a, b]
+
+    for _ in range(6):
+        track(tracker, [box(300, 0)])
+    # それより長く見失うと別の人として扱う
+    assert track(tracker, [box(0, 0), box(300, 0)]) == [2, b]
+
+
+def test_new_face_takes_longest_missing_slot_when_full():
+    tracker = FaceTracker(max_faces=2, max_missing=30)
+    a, b = track(tracker, [box(0, 0), box(300, 0)])
+    track(tracker, [])
+    track(tracker, [box(300, 0)])
+    # 枠が埋まっている（どちらも追跡中）ところに別の場所で新しい顔
+    new = track(tracker, [box(300, 0), box(900, 500)])
+    assert new == [b, 2]
+    assert a not in tracker.ids.tolist()
+
+
+def test_detections_beyond_max_faces_are_dropped():
+    def face(x):
+        points = [FakePoint(0.5, 0.5) for _ in range(NUM_LANDMARKS)]
+        for i, (bx, by) in zip(FACE_BOUND_ROWS, [(x, 0.1), (x, 0.3), (x - 0.1, 0.2), (x + 0.1, 0.2)]):
+            points[i] = FakePoint(bx, by)
+        return points
+
+    points = MultiLandmarkArray(max_faces=2)
+    tracker = FaceTracker(max_faces=2)
+    n = points.fill([face(0.2), face(0.5), face(0.8)], 640, 480, rows=FACE_BOUND_ROWS)
+    assert n == 2
+    slots = tracker.associate(points.bounds())
+    assert sorted(tracker.ids[slots].tolist()) == [0, 1]
+
+
+def test_face_states_follow_ids_and_reset_on_new_face():
+    states = FaceStates(max_faces=2)
+    slots = np.array([0, 1])
+    ids = np.array([0, 1])
+    for t in range(10):
+        states.update(slots, ids, np.array([CENTER, LEFT], np.int8), t, 5.0, 10.0)
+    # 検出の順が入れ替わっても枠番号で同じ顔の状態に足される
+    states.update(slots[::-1], ids[::-1], np.array([LEFT, CENTER], np.int8), 10, 5.0, 10.0)
+    assert states.total_frames.tolist() == [11, 11]
+    assert states.focused_frames.tolist() == [11, 0]
+
+    # 枠 1 に別の人（ID 2）が入ったら統計は初期化
+    states.update(slots, np.array([0, 2]), np.array([CENTER, CENTER], np.int8), 11, 5.0, 10.0)
+    assert states.total_frames.tolist() == [12, 1]
+    assert [f['face'] for f in states.summary(np.array([True, True]))] == [0, 2]
@@ -0,0 +1,80 @@
+import types
+
+import cv2
+import numpy as np
+
+from landmarks import NUM_LANDMARKS, LEFT_IRIS, RIGHT_IRIS
+from replay import replay_video
+from roi import FACE_BOUND_ROWS
+
+FPS = 30.0
+SIZE = (160, 120)
+
+
+class FakePoint:
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x, y, z=0.0):
+        self.x, self.y, self.z = x, y, z
+
+
+def fake_face(x):
+    """虹彩が正規化座標 x にある顔（0.5 で CENTER）"""
+    points = [FakePoint(0.5, 0.5) for _ in range(NUM_LANDMARKS)]
+    # 外接矩形が画面全体になるように（ROI で切り出しても座標が変わらない）
+    for i, (bx, by) in zip(FACE_BOUND_ROWS, [(0.5, 0.0), (0.5, 1.0), (0.0, 0.5), (1.0, 0.5)]):
+        points[i] = FakePoint(bx, by)
+    for i in LEFT_IRIS:
+        points[i] = FakePoint(x + 0.02, 0.5)
+    for i in RIGHT_IRIS:
+        points[i] = FakePoint(x - 0.02, 0.5)
+    return types.SimpleNamespace(landmark=points)
+
+
+class FakeFaceMesh:
+    """フレームの明るさで視線を決める FaceMesh（明るい: CENTER / 暗い: LEFT / 真っ黒: 顔なし）"""
+
+    def process(self, rgb):
+        level = int(rgb[..., 0].mean())
+        if level < 20:
+            return types.SimpleNamespace(multi_face_landmarks=None)
+        x = 0.5 if level > 160 else 0.1
+        return types.SimpleNamespace(multi_face_landmarks=[fake_face(x)])
+
+    def close(self):
+        pass
+
+
+def write_video(path, levels):
+    """フレームごとの明るさのリストから動画を作る"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), FPS, SIZE)
+    for level in levels:
+        writer.write(np.full((SIZE[1], SIZE[0], 3), level, np.uint8))
+    writer.release()
+    return str(path)
+
+
+def gaze_levels(pattern):
+    """[(秒数, "C" / "L" / "-"), ...] → フレームごとの明るさ"""
+    level = {"C": 220, "L": 100, "-": 0}
+    return [level[kind] for seconds, kind in pattern for _ in range(int(seconds * FPS))]
+
+
+def summarize(path, **monitor_kwargs):
+    monitor_kwargs.setdefault('face_mesh', FakeFaceMesh())
+    monitor_kwargs.setdefault('use_roi', False)
+    records = list(replay_video(path, monitor_kwargs=monitor_kwargs))
+    return records[-1]
+
+
+def test_focus_rate_does_not_depend_on_adaptive_rate(tmp_path):
+    path = write_video(tmp_path / "gaze.avi",
+                       gaze_levels([(6, "C"), (2, "L"), (8, "C"), (1, "L"), (3, "-"), (5, "C")]))
+    adaptive = summarize(path)
+    full = summarize(path, adaptive_rate=False)
+    # 間引いたフレームがあることを確認（なければこのテストの意味がない）
+    assert adaptive['skipped_frames'] > adaptive['frames'] / 2
+    assert full['skipped_frames'] == 0
+    # 差は方向が変わってから次の推論までの遅れ（最大 1/min_fps 秒）の分だけ
+    assert abs(adaptive['focus_rate'] - full['focus_rate']) < 2.0
+    assert abs(adaptive['total_frames'] - full['total_frames']) <= 2 * FPS / 5
@@ -0,0 +1,47 @@
+import random
+
+from replay import VideoClock
+from scheduler import AdaptiveScheduler
+
+
+def run(times, max_fps=30):
+    """毎フレーム方向が変わる（不安定な）入力で、推論したフレーム数を返す"""
+    scheduler = AdaptiveScheduler(max_fps=max_fps)
+    inferred = 0
+    for now in times:
+        if scheduler.due(now):
+            inferred += 1
+            scheduler.observe(now, "LEFT" if inferred % 2 else "RIGHT", (0.0, 0.0))
+    return inferred
+
+
+def test_unstable_input_is_never_skipped_with_video_clock():
+    for fps in (25, 29.97, 30):
+        clock = VideoClock(fps)
+        times = []
+        for i in range(3000):
+            clock.frame_index = i
+            times.append(clock())
+        assert run(times) == len(times), fps
+
+
+def test_unstable_input_is_never_skipped_with_camera_jitter():
+    rng = random.Random(0)
+    times = [i / 30 + rng.uniform(-0.002, 0.002) for i in range(3000)]
+    assert run(times) == len(times)
+
+
+def test_faster_camera_is_still_limited_to_max_fps():
+    times = [i / 60 for i in range(600)]
+    assert run(times, max_fps=30) == 300
+
+
+def test_stable_input_reduces_rate():
+    scheduler = AdaptiveScheduler(max_fps=30, min_fps=5)
+    inferred = 0
+    for i in range(300):
+        now = i / 30
+        if scheduler.due(now):
+            inferred += 1
+            scheduler.observe(now, "CENTER", (0.0, 0.0))
+    assert inferred < 100
@@ -0,0 +1,227 @@
+import math
+
+from PIL import Image, ImageDraw, ImageTk
+
+from rects import clip, intersect, inflate, tiles_in
+
+
+class Pyramid:
+    """縮小表示用のミップマップ（1/2, 1/4, ... を必要になった段だけ作る）
+
+    levels[0] は元画像そのもの（コピーしない）。update() で変わった範囲だけ
+    各段を作り直す。
+    """
+
+    def __init__(self, image, max_level=3):
+        self.levels = [image]
+        self.max_level = max_level
+
+    def level_for(self, zoom):
+        """zoom 倍で表示するときに縮小元にする段 (k, 画像)。1/2^k >= zoom となる最大の k"""
+        k = 0
+        while k < self.max_level and zoom <= 0.5 ** (k + 1):
+            k += 1
+        while len(self.levels) <= k:
+            self.levels.append(self.levels[-1].reduce(2))
+        return k, self.levels[k]
+
+    def update(self, rect=None):
+        """元画像の rect（None なら全体）が変わった → 作成済みの段の同じ範囲を作り直す"""
+        for k in range(1, len(self.levels)):
+            prev, level = self.levels[k - 1], self.levels[k]
+            if rect is None:
+                self.levels[k] = prev.reduce(2)
+                continue
+            s = 1 << k
+            r = clip((rect[0] // s, rect[1] // s, -(-rect[2] // s), -(-rect[3] // s)), *level.size)
+            if r is None:
+                continue
+            src = clip((r[0] * 2, r[1] * 2, r[2] * 2, r[3] * 2), *prev.size)
+            level.paste(prev.crop(src).reduce(2), r[:2])
+
+
+class TileView:
+    """合成画像をタイルに分けて Canvas に表示し、見えている範囲のタイルだけ転送する
+
+    タイルは表示座標（ズーム後）で tile_size 四方に区切り、Canvas の表示範囲に
+    かかるものだけ作る。各タイルは元画像の対応範囲を切り出してから拡大・縮小する
+    （縮小表示ではミップマップから）ので、1回の処理量はウィンドウの大きさで決まり、
+    ズーム倍率や文書の大きさによらない。
+    更新時は PhotoImage.paste() で中身だけ差し替え、パンはアイテムの移動と
+    見えてきたタイルの追加・見えなくなったタイルの破棄だけ行う。
+    """
+
+    def __init__(self, canvas, tile_size=256, tag="bg", max_level=3):
+        self.canvas = canvas
+        self.tile_size = tile_size
+        self.tag = tag
+        self.max_level = max_level
+        self.tiles = {}         # (tx, ty) -> [PhotoImage, Canvas アイテム]
+        self.image = None
+        self.pyramid = None
+        self.zoom = None
+        self.offset = (0, 0)
+
+    def clear(self):
+        self.canvas.delete(self.tag)
+        self.tiles.clear()
+
+    def viewport_size(self):
+        w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if w <= 1 or h <= 1:
+            # まだ表示されていない（サイズ未確定）ときは指定サイズ
+            w, h = int(self.canvas["width"]), int(self.canvas["height"])
+        return w, h
+
+    def render(self, image, zoom, offset_x, offset_y, rect=None, changed=True):
+        """rect（画像座標、None なら全体）に重なる、見えているタイルを転送する
+
+        changed=False は表示だけの変更（ズームなど）で画素は前回と同じ。
+        ミップマップを作り直さないので、文書の大きさによらない。
+        """
+        if image is not self.image:
+            self.image = image
+            self.pyramid = Pyramid(image, self.max_level)
+            self.zoom = None
+        elif changed:
+            self.pyramid.update(rect)
+
+        if zoom != self.zoom:
+            self.clear()
+            self.zoom = zoom
+            self.offset = (offset_x, offset_y)
+            rect = None
+        else:
+            self._move(offset_x, offset_y)
+
+        visible = self._visible()
+        if rect is None:
+            for key in tiles_in(visible, self.tile_size):
+                self._update_tile(*key)
+        else:
+            for key in tiles_in(self._display_rect(rect), self.tile_size):
+                if intersect(self._tile_box(*key), visible) is not None:
+                    self._update_tile(*key)
+                elif key in self.tiles:
+                    # 見えていないタイルは捨てて、見えたときに作り直す
+                    self._drop(key)
+        self._sync(visible)
+
+    def move_to(self, offset_x, offset_y):
+        """パン：アイテムを移動し、見えてきたタイルだけ作る（既存タイルは再転送しない）"""
+        self._move(offset_x, offset_y)
+        if self.image is not None:
+            self._sync(self._visible())
+
+    def _move(self, offset_x, offset_y):
+        if (offset_x, offset_y) != self.offset:
+            self.canvas.move(self.tag, offset_x - self.offset[0], offset_y - self.offset[1])
+            self.offset = (offset_x, offset_y)
+
+    # ---- 座標 ----
+    def _doc_size(self):
+        w, h = self.image.size
+        return max(1, int(w * self.zoom)), max(1, int(h * self.zoom))
+
+    def _visible(self):
+        """表示座標で見えている範囲（文書の外は除く）"""
+        vw, vh = self.viewport_size()
+        ox, oy = self.offset
+        return clip((-ox, -oy, vw - ox, vh - oy), *self._doc_size())
+
+    def _display_rect(self, rect):
+        """画像座標の矩形 → 表示座標の矩形（はみ出す側に丸める）"""
+        z = self.zoom
+        return (math.floor(rect[0] * z), math.floor(rect[1] * z),
+                math.ceil(rect[2] * z), math.ceil(rect[3] * z))
+
+    def _tile_box(self, tx, ty):
+        dw, dh = self._doc_size()
+        t = self.tile_size
+        return tx * t, ty * t, min(dw, (tx + 1) * t), min(dh, (ty + 1) * t)
+
+    # ---- タイル ----
+    def _sync(self, visible):
+        """見えているのに無いタイルを作り、十分離れたタイルを捨てる"""
+        for key in tiles_in(visible, self.tile_size):
+            if key not in self.tiles:
+                self._update_tile(*key)
+        keep = inflate(visible, self.tile_size)
+        for key in [k for k in self.tiles if intersect(self._tile_box(*k), keep) is None]:
+            self._drop(key)
+
+    def _drop(self, key):
+        self.canvas.delete(self.tiles.pop(key)[1])
+
+    def _update_tile(self, tx, ty):
+        box = self._tile_box(tx, ty)
+        size = (box[2] - box[0], box[3] - box[1])
+        if size[0] <= 0 or size[1] <= 0:
+            return
+
+        if self.zoom == 1.0:
+            tile = self.image.crop(box)
+        else:
+            # 表示範囲に対応する元画像の範囲だけを拡大・縮小する（継ぎ目が出ないよう box で指定）
+            k, source = self.pyramid.level_for(self.zoom)
+            scale = 1.0 / (self.zoom * (1 << k))
+            region = (box[0] * scale, box[1] * scale,
+                      min(source.width, box[2] * scale), min(source.height, box[3] * scale))
+            tile = source.resize(size, resample=Image.BILINEAR, box=region)
+
+        entry = self.tiles.get((tx, ty))
+        if entry is not None:
+            entry[0].paste(tile)
+            return
+
+        photo = ImageTk.PhotoImage(tile)
+        item = self.canvas.create_image(self.offset[0] + box[0], self.offset[1] + box[1],
+                                        image=photo, anchor="nw", tags=(self.tag,))
+        # グリッドや一時図形より下に置く
+        self.canvas.tag_lower(item)
+        self.tiles[(tx, ty)] = [photo, item]
+
+
+class GridOverlay:
+    """グリッドを透明な1枚の画像として Canvas に置く
+
+    画像は表示範囲より1マス大きく作っておき、パンではマス目の端数だけずらして
+    置き直す。作り直すのは間隔（ズーム）か表示サイズが変わったときだけ。
+    """
+
+    def __init__(self, canvas, color="#cccccc", tag="grid"):
+        self.canvas = canvas
+        self.color = color
+        self.tag = tag
+        self.photo = None
+        self.item = None
+        self.key = None         # (間隔, 幅, 高さ)
+
+    def hide(self):
+        if self.item is not None:
+            self.canvas.delete(self.item)
+        self.photo = self.item = self.key = None
+
+    def show(self, step, offset_x, offset_y, size):
+        """間隔 step（表示ピクセル）のグリッドを、線が offset の位置に揃うように置く"""
+        if step <= 0:
+            self.hide()
+            return
+        key = (step, size[0], size[1])
+        if key != self.key:
+            self.hide()
+            self.key = key
+            self.photo = ImageTk.PhotoImage(self._render(step, size[0] + step, size[1] + step))
+            self.item = self.canvas.create_image(0, 0, image=self.photo, anchor="nw",
+                                                 tags=(self.tag,))
+        self.canvas.coords(self.item, offset_x % step - step, offset_y % step - step)
+        self.canvas.tag_raise(self.item)
+
+    def _render(self, step, w, h):
+        image = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        for x in range(0, w, step):
+            draw.line([x, 0, x, h], fill=self.color)
+        for y in range(0, h, step):
+            draw.line([0, y, w, y], fill=self.color)
+        return image
@@ -5,6 +5,7 @@ from utils import power, scheduler, network, security
 from utils.scheduler import run_scheduled_tasks
 import threading
 import fast_module as fast_module
+from ring_buffer import FrameRingBuffer
 
 network_latency = {"ping_ms": None}
 
@@ -36,11 +37,17 @@ def main():
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     out = cv2.VideoWriter("output/camera_output.mp4", fourcc, fps, (width, height))
 
-    frame_buffer = []
+    # フレームバッファ（cap.read() がリングバッファへ直接書き込む）
     window_size = 16
+    frame_buffer = FrameRingBuffer(window_size, height, width)
+
+    # 描画・差分用の作業バッファ（毎フレーム確保しない）
+    frame_py = np.empty((height, width, 3), np.uint8)
+    frame_cpp = np.empty((height, width, 3), np.uint8)
+    diff = np.empty((height, width, 3), np.uint8)
 
     while True:
-        ret, frame = cap.read()
+        ret, frame = frame_buffer.read(cap)
 
         if not ret:
             break
@@ -48,17 +55,17 @@ def main():
         # 人検出
         boxes, scores = detect_people(frame)
 
-        # Python版描画
-        frame_py = frame.copy()
+        # Python版描画（元フレームはバッファに残すため作業バッファへ複製）
+        np.copyto(frame_py, frame)
         visualize_detections(frame_py, boxes, scores)
 
         # C++版描画
-        frame_cpp = frame.copy()
+        np.copyto(frame_cpp, frame)
         # fast_module.visualize_detections は py::array_t<uint8_t> を想定しているので numpy を渡す
         fast_module.visualize_detections(frame_cpp, boxes.tolist(), scores.tolist())
 
         # ピクセル差分
-        diff = cv2.absdiff(frame_py, frame_cpp)
+        cv2.absdiff(frame_py, frame_cpp, dst=diff)
         mae = np.mean(diff)
         print(f"Python vs C++ 描画差分（MAE）: {mae:.2f}")
 
@@ -93,9 +100,8 @@ def main():
         # out.write(display)
 
         # # 🔽 ★ 必要に応じてバッファ保持（後で動作認識に使うなど）
-        # frame_buffer.append(frame)
-        # if len(frame_buffer) > window_size:
-        #     frame_buffer.pop(0)
+        # # frame_buffer には直近 window_size 枚が入っている（コピーなしのビュー）
+        # clip = frame_buffer.last(window_size)
 
         # # 'q' で終了
         # if cv2.waitKey(1) & 0xFF == ord('q'):